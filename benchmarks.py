@@ -0,0 +1,201 @@
+import argparse
+from datetime import datetime
+import json
+import os
+import platform
+import time
+
+import numba
+import numpy as np
+
+from genetic_algoritms.crossovers import gap_crossovers
+from genetic_algoritms.mutations import gap_mutations
+from genetic_algoritms.nsgaII.evaluation import (fast_non_dominated_sort,
+                                                 crowding_distance)
+from initializations import generate_population
+from load_data_and_constants import N_CHOICES, N_DAYS, synthetic_problem
+from metrics import (apply_cost_function, compute_daily_costs,
+                     computes_occ_acc_costs, cost_function)
+from tabu_search.neighborhood import find_best_new_assignment, get_neighbor
+from utils import seed_compiled_functions
+
+BENCHMARKS_DIR = 'data/benchmarks'
+
+
+def time_kernel(setup, kernel, n_repeats):
+    """Times kernel(*setup()) once to warm it up (compilation or loading
+    from the on-disk cache), then n_repeats times in steady state. setup
+    is not timed.
+
+    :return: warmup time, steady state times and the result of the last
+             call.
+    """
+    args = setup()
+    start = time.perf_counter()
+    kernel(*args)
+    warmup_time = time.perf_counter() - start
+    times = []
+    for _ in range(n_repeats):
+        args = setup()
+        start = time.perf_counter()
+        result = kernel(*args)
+        times.append(time.perf_counter() - start)
+    return warmup_time, np.array(times), result
+
+
+def hot_paths(problem, population, costs_array):
+    """Benchmarked kernels.
+
+    :return: list of (name, setup, kernel, unit, work) where work(result)
+             is the number of units processed by one call.
+    """
+    solution = population[0]
+    daily_costs = compute_daily_costs(problem, solution)
+    tabu_matrix = -np.ones((len(solution), problem.n_days))
+    occ_costs, acc_costs = computes_occ_acc_costs(problem, population)
+    family_idx = np.argmax(problem.cost_matrix[np.arange(len(solution)),
+                                               solution - 1])
+    ranks = fast_non_dominated_sort(costs_array)[1]
+    n_individuals = len(population)
+    offsprings = np.zeros((2 * n_individuals, population.shape[1]),
+                          dtype=population.dtype)
+    parents_idx = np.zeros(len(offsprings), dtype=np.int64)
+    changed = np.zeros(offsprings.shape, dtype=np.bool_)
+    return [
+        ('cost_function', lambda: (problem, solution), cost_function,
+         'evaluations', lambda result: 1),
+        ('apply_cost_function', lambda: (problem, population),
+         apply_cost_function, 'evaluations', lambda result: n_individuals),
+        ('computes_occ_acc_costs', lambda: (problem, population),
+         computes_occ_acc_costs, 'evaluations',
+         lambda result: n_individuals),
+        ('find_best_new_assignment',
+         lambda: (problem, solution, family_idx, daily_costs, tabu_matrix,
+                  0),
+         find_best_new_assignment, 'moves', lambda result: result[3]),
+        ('get_neighbor',
+         lambda: (problem, solution, [], 0., 10, tabu_matrix, 0),
+         get_neighbor, 'moves', lambda result: result[3]),
+        ('gap_crossovers',
+         lambda: (problem, population, 0.5, offsprings, parents_idx,
+                  changed),
+         gap_crossovers, 'offsprings', lambda result: len(offsprings)),
+        ('gap_mutations',
+         lambda: (problem, population.copy(), 1., 1., 0.5, 0.5, occ_costs,
+                  acc_costs),
+         gap_mutations, 'individuals', lambda result: n_individuals),
+        ('generate_population', lambda: (problem, n_individuals),
+         generate_population, 'individuals', lambda result: len(result)),
+        ('fast_non_dominated_sort', lambda: (costs_array,),
+         fast_non_dominated_sort, 'individuals', lambda result: len(ranks)),
+        ('crowding_distance', lambda: (costs_array, ranks),
+         crowding_distance, 'individuals', lambda result: len(ranks)),
+    ]
+
+
+def run_benchmarks(n_families=5000, population_size=100,
+                   n_nsga_individuals=10000, n_repeats=10, seed=0,
+                   n_days=N_DAYS, n_choices=N_CHOICES):
+    """Times the hot paths on a seeded synthetic instance of n_families
+    over n_days (see load_data_and_constants.synthetic_problem).
+
+    :return: dict of the benchmark settings and, for each kernel, its
+             warmup time, steady state times and throughput.
+    """
+    problem = synthetic_problem(n_families, n_days, n_choices, seed=seed)
+    seed_compiled_functions(seed)
+    population = generate_population(problem, population_size)
+    # Two objectives costs shaped like the GA ones (occupancy and
+    # accounting costs of a population).
+    rng = np.random.default_rng(seed)
+    occ_costs = rng.uniform(1e5, 1e7, n_nsga_individuals)
+    acc_costs = 1e12 / occ_costs * rng.uniform(1, 2, n_nsga_individuals)
+    costs_array = np.vstack([occ_costs, acc_costs]).T
+
+    results = {}
+    for name, setup, kernel, unit, work in hot_paths(problem, population,
+                                                     costs_array):
+        warmup_time, times, result = time_kernel(setup, kernel, n_repeats)
+        median_time = float(np.median(times))
+        results[name] = {
+            'warmup_time': warmup_time,
+            'min_time': float(times.min()),
+            'median_time': median_time,
+            'times': times.tolist(),
+            'unit': unit,
+            'throughput': work(result) / median_time
+            if median_time > 0 else float('inf')
+        }
+    return {
+        'date': datetime.now().isoformat(),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'numba': numba.__version__,
+        'n_threads': numba.get_num_threads(),
+        'settings': {
+            'n_families': n_families,
+            'n_days': n_days,
+            'n_choices': n_choices,
+            'min_occupancy': problem.min_occupancy,
+            'max_occupancy': problem.max_occupancy,
+            'population_size': population_size,
+            'n_nsga_individuals': n_nsga_individuals,
+            'n_repeats': n_repeats,
+            'seed': seed
+        },
+        'results': results
+    }
+
+
+def compare(baseline_path, path):
+    """Ratio of the median times of path over the ones of baseline_path
+    for each kernel (above 1 is a regression).
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)['results']
+    with open(path) as f:
+        results = json.load(f)['results']
+    return {
+        name: results[name]['median_time'] / baseline[name]['median_time']
+        for name in results if name in baseline
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Times the hot kernels on a synthetic instance.'
+    )
+    parser.add_argument('--n-families', type=int, default=5000)
+    parser.add_argument('--n-days', type=int, default=N_DAYS)
+    parser.add_argument('--n-choices', type=int, default=N_CHOICES)
+    parser.add_argument('--population-size', type=int, default=100)
+    parser.add_argument('--n-nsga-individuals', type=int, default=10000)
+    parser.add_argument('--n-repeats', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None,
+                        help=f'json file, in {BENCHMARKS_DIR} by default')
+    parser.add_argument('--baseline', default=None,
+                        help='json file of a previous run to compare with')
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.n_families, args.population_size,
+                            args.n_nsga_individuals, args.n_repeats,
+                            args.seed, args.n_days, args.n_choices)
+    for name, result in report['results'].items():
+        print(f'{name}: warmup {result["warmup_time"]:.3f}s - '
+              f'median {result["median_time"] * 1e3:.3f}ms - '
+              f'{result["throughput"]:.0f} {result["unit"]}/s')
+    output = args.output
+    if output is None:
+        os.makedirs(BENCHMARKS_DIR, exist_ok=True)
+        output = os.path.join(
+            BENCHMARKS_DIR,
+            f'{datetime.now().strftime("%Y%m%d-%H%M%S")}.json'
+        )
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Saved in {output}')
+    if args.baseline is not None:
+        for name, ratio in compare(args.baseline, output).items():
+            print(f'{name}: x{ratio:.2f} median time')
@@ -0,0 +1,138 @@
+import json
+import os
+import shutil
+import tempfile
+
+from numba import _helperlib
+import numpy as np
+
+CHECKPOINT_DIR = 'data/checkpoints'
+
+
+def get_random_states():
+    """States of the numpy random generator and of the random generator of
+    numba compiled functions (see utils.seed_compiled_functions).
+
+    :return: arrays and json serializable values of the states.
+    """
+    _, numpy_keys, numpy_pos, has_gauss, cached_gaussian = \
+        np.random.get_state()
+    numba_index, numba_keys = _helperlib.rnd_get_state(
+        _helperlib.rnd_get_np_state_ptr()
+    )
+    arrays = {
+        'numpy_rng_keys': numpy_keys,
+        'numba_rng_keys': np.array(numba_keys, dtype=np.uint32)
+    }
+    values = {
+        'numpy_rng': [int(numpy_pos), int(has_gauss), float(cached_gaussian)],
+        'numba_rng_index': int(numba_index)
+    }
+    return arrays, values
+
+
+def set_random_states(arrays, values):
+    numpy_pos, has_gauss, cached_gaussian = values['numpy_rng']
+    np.random.set_state(('MT19937', np.array(arrays['numpy_rng_keys']),
+                         numpy_pos, has_gauss, cached_gaussian))
+    _helperlib.rnd_set_state(
+        _helperlib.rnd_get_np_state_ptr(),
+        (values['numba_rng_index'],
+         [int(key) for key in arrays['numba_rng_keys']])
+    )
+
+
+class Checkpoint():
+    """Last state of a solver and its statistics, in a directory:
+
+    - the state is a snapshot directory of .npy arrays and a json file of
+      values, including the states of the random generators. A new snapshot
+      is written next to the previous one, which is only removed once the
+      'latest' file points to the new one, so that a preempted run always
+      finds a complete state.
+    - statistics are fixed-size records appended to a binary file, one per
+      iteration or generation, read as a memory-mapped structured array.
+    """
+
+    def __init__(self, path, stats_fields):
+        self.path = path
+        self.stats_dtype = np.dtype([(field, np.float64)
+                                     for field in stats_fields])
+        self.stats_path = os.path.join(path, 'stats.bin')
+        os.makedirs(path, exist_ok=True)
+
+    def latest_snapshot(self):
+        latest_path = os.path.join(self.path, 'latest')
+        if not os.path.exists(latest_path):
+            return None
+        with open(latest_path) as f:
+            return os.path.join(self.path, f.read())
+
+    def save(self, arrays, values):
+        """Writes a new snapshot of the solver state.
+
+        :param arrays: dict of numpy arrays
+        :param values: dict of json serializable values
+        """
+        random_arrays, random_values = get_random_states()
+        values = dict(values, **random_values,
+                      n_stats=self.n_stats())
+        snapshot_path = tempfile.mkdtemp(prefix='snapshot-', dir=self.path)
+        for name, array in dict(arrays, **random_arrays).items():
+            np.save(os.path.join(snapshot_path, name + '.npy'),
+                    np.asarray(array))
+        with open(os.path.join(snapshot_path, 'state.json'), 'w') as f:
+            json.dump(values, f)
+
+        latest_tmp_path = os.path.join(self.path, 'latest.tmp')
+        with open(latest_tmp_path, 'w') as f:
+            f.write(os.path.basename(snapshot_path))
+        os.replace(latest_tmp_path, os.path.join(self.path, 'latest'))
+        # Previous snapshot, and any snapshot left incomplete by a preemption
+        for name in os.listdir(self.path):
+            if name.startswith('snapshot-') and \
+                    name != os.path.basename(snapshot_path):
+                shutil.rmtree(os.path.join(self.path, name),
+                              ignore_errors=True)
+
+    def load(self):
+        """Reads the last snapshot, restores the random generators and drops
+        the statistics appended after it.
+
+        :return: memory-mapped arrays and values of the state, None if
+                 there is no checkpoint.
+        """
+        snapshot_path = self.latest_snapshot()
+        if snapshot_path is None:
+            return None
+        with open(os.path.join(snapshot_path, 'state.json')) as f:
+            values = json.load(f)
+        arrays = {
+            file_name[:-len('.npy')]: np.load(
+                os.path.join(snapshot_path, file_name), mmap_mode='r'
+            )
+            for file_name in os.listdir(snapshot_path)
+            if file_name.endswith('.npy')
+        }
+        set_random_states(arrays, values)
+        if os.path.exists(self.stats_path):
+            os.truncate(self.stats_path,
+                        values['n_stats'] * self.stats_dtype.itemsize)
+        return arrays, values
+
+    def append_stats(self, *values):
+        with open(self.stats_path, 'ab') as f:
+            f.write(np.array(values, dtype=np.float64).tobytes())
+
+    def n_stats(self):
+        if not os.path.exists(self.stats_path):
+            return 0
+        return os.path.getsize(self.stats_path) // self.stats_dtype.itemsize
+
+    def stats(self):
+        """Memory-mapped structured array of the statistics records."""
+        n_stats = self.n_stats()
+        if n_stats == 0:
+            return np.zeros(0, dtype=self.stats_dtype)
+        return np.memmap(self.stats_path, dtype=self.stats_dtype, mode='r',
+                         shape=(n_stats,))
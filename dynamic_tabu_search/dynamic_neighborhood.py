@@ -1,95 +1,124 @@
-from sklearn.neighbors import BallTree
+import hashlib
+import os
+import tempfile
+
 from numba import njit, jit
 import numpy as np
 
+from load_data_and_constants import CACHE_DIR
 from metrics import (computes_family_occ_costs, computes_total_costs,
-                     family_distance)
-from load_data_and_constants import cost_matrix, data_array
+                     family_neighbors)
 from utils import proportional_random_choice
+from dynamic_tabu_search.tabu_memory import TabuMemory
+
 
+def load_family_neighbors(problem, k, cache_dir=CACHE_DIR):
+    """Closest families of each family (see metrics.family_neighbors),
+    computed once per instance and k, and memory-mapped from cache_dir.
 
-tree = BallTree(
-    data_array,
-    metric=family_distance
-)
+    :return: (n_families, k) array of family indices.
+    """
+    instance_hash = hashlib.sha256(
+        np.ascontiguousarray(problem.data_array).tobytes() +
+        np.ascontiguousarray(problem.weights).tobytes()
+    ).hexdigest()[:16]
+    path = os.path.join(cache_dir, f'family_neighbors_{instance_hash}_{k}.npy')
+    if not os.path.exists(path):
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix='.npy', dir=cache_dir)
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, family_neighbors(problem, k))
+        os.replace(tmp_path, path)
+    return np.asarray(np.load(path, mmap_mode='r'))
 
 
 class DynamicNeighborhood():
     def __init__(self, tabu_search, neighborhood_size=2000,
                  family_neighbor_size=100):
         self.ts = tabu_search
+        self.problem = tabu_search.problem
         self.neighborhood_size = neighborhood_size
         self.family_neighbor_size = family_neighbor_size
+        self.neighbors = load_family_neighbors(self.problem,
+                                               family_neighbor_size)
 
-    def get_neighbor(self, solution: np.array) -> np.array:
+    def get_neighbor(self, solution: np.array, solution_hash: int) -> tuple:
         """Because it is inefficient to explore all the neighbors of a
         given solution. This function samples only a fixed number of neighbors
         and returns the best one.
 
         :param solution: current solution
+        :param solution_hash: hash of solution (see TabuMemory.hash)
+        :return: best neighbor, its score, its hash and the number of
+                 neighbors explored.
         """
 
-        family_costs = computes_family_occ_costs(solution)
+        family_costs = computes_family_occ_costs(self.problem, solution)
         list_families = list(range(len(solution)))
 
         n_explored_neighbors = 0
+        best_neighbor = solution
         best_neighbor_score = np.inf
+        best_neighbor_hash = solution_hash
         while n_explored_neighbors <= self.neighborhood_size:
             random_idx = proportional_random_choice(family_costs, 1)[0]
             family_idx = list_families[random_idx]
             family_costs = np.delete(family_costs, random_idx)
             del list_families[random_idx]
 
-            best_move, best_move_score, n = \
-                find_best_new_move(solution, family_idx,
-                                   self.family_neighbor_size,
-                                   self.ts.tabu_list, self.ts.iter)
+            best_move, best_move_score, best_move_hash, n = \
+                find_best_new_move(self.problem, solution, solution_hash,
+                                   family_idx, self.neighbors,
+                                   self.ts.tabu_memory,
+                                   self.ts.iter, self.ts.fitness_cache)
 
             n_explored_neighbors += n
 
             if best_move_score < best_neighbor_score:
                 best_neighbor_score = best_move_score
                 best_neighbor = best_move
+                best_neighbor_hash = best_move_hash
             if best_neighbor_score < self.ts.best_score:
                 break
 
-        return best_neighbor, best_neighbor_score
-
-
-# @njit
-def is_tabu_active(solution: np.array,
-                   tabu_list: np.array) -> bool:
-    """A feasible move is a shift or a swap that is not tabu active.
-    """
-    return (solution.reshape((-1, 1)) == tabu_list).all(axis=0).any()
+        return (best_neighbor, best_neighbor_score, best_neighbor_hash,
+                n_explored_neighbors)
 
 
 # @njit
-def get_shifts(solution: np.array, family_idx: int,
-               tabu_list: np.array,
+def get_shifts(problem, solution: np.array, solution_hash: int,
+               family_idx: int, tabu_memory: TabuMemory,
                iter: int) -> tuple([list, list]):
     """
     Finds new moves of family_idx resulting from switching its current
-    choice with other preferred choices.
+    choice with other preferred choices. A move is feasible if the
+    resulting solution is not tabu active.
 
     :param solution: 1D solution array
+    :param solution_hash: hash of solution (see TabuMemory.hash)
     :param family_idx: index mapping a family choice in solution
+    :return: feasible moves and their hashes.
     """
     current_choice = solution[family_idx]
-    list_choices = data_array[family_idx]
+    list_choices = problem.data_array[family_idx]
     shifts = []
+    hashes = []
     for new_choice in list_choices:
         if (new_choice != current_choice):
+            shift_hash = tabu_memory.move_hash(solution_hash, solution,
+                                               family_idx, new_choice)
+            if shift_hash in tabu_memory:
+                continue
             shift = solution.copy()
             shift[family_idx] = new_choice
-            if is_tabu_active(shift, tabu_list):
-                continue
             shifts.append(shift)
-    return shifts
+            hashes.append(shift_hash)
+    return shifts, hashes
 
 
-def get_swaps(solution: np.array, family_idx: int, k: int,
-              tabu_list: np.array,
+def get_swaps(problem, solution: np.array, solution_hash: int,
+              family_idx: int, neighbors: np.array,
+              tabu_memory: TabuMemory,
               iter: int) -> tuple([list, list]):
     """
     Finds all new moves of family_idx resulting from swapping its choices
@@ -97,52 +126,68 @@ def get_swaps(solution: np.array, family_idx: int, k: int,
     distance metric between families (see metrics.family_distance).
 
     :param solution: 1D solution array
+    :param solution_hash: hash of solution (see TabuMemory.hash)
     :param family_idx: index mapping a family choice in solution
-    :param k: number of closest families to consider
+    :param neighbors: closest families of each family
+                      (see load_family_neighbors)
+    :return: feasible moves and their hashes.
     """
-    dist, ind = tree.query(
-        data_array[family_idx:family_idx+1],
-        k=k
-    )
     swaps = []
+    hashes = []
     current_choice = solution[family_idx]
-    for swap_idx in ind[0][1:]:
+    for swap_idx in neighbors[family_idx]:
         if swap_idx != family_idx:
+            new_choice = solution[swap_idx]
+            swap_hash = tabu_memory.move_hash(solution_hash, solution,
+                                              family_idx, new_choice,
+                                              swap_idx)
+            if swap_hash in tabu_memory:
+                continue
             swap = solution.copy()
-            new_choice = swap[swap_idx]
             swap[family_idx] = new_choice
             swap[swap_idx] = current_choice
+            swaps.append(swap)
+            hashes.append(swap_hash)
 
-            if is_tabu_active(swap, tabu_list):
-                continue
-
-    return swaps
+    return swaps, hashes
 
 
 # @njit
-def find_best_new_move(solution: np.array, family_idx: int, k: int,
-                             tabu_list, iter):
+def find_best_new_move(problem, solution: np.array, solution_hash: int,
+                       family_idx: int, neighbors, tabu_memory, iter,
+                       fitness_cache=None):
     """
     Lists all new feasible moves for a given family_idx. Evaluate them
     and return the best one.
 
     :param solution: 1D solution array
+    :param solution_hash: hash of solution (see TabuMemory.hash)
     :param family_idx: index mapping a family choice in solution
-    :param k: see get_swaps definition
+    :param neighbors: see get_swaps definition
+    :param fitness_cache: FitnessCache with the keys of tabu_memory, moves
+                          already scored are then not evaluated again.
+    :return: best move, its score, its hash and the number of moves.
     """
-    shifts = get_shifts(
-        solution, family_idx,
-        tabu_list, iter
+    shifts, shift_hashes = get_shifts(
+        problem, solution, solution_hash, family_idx,
+        tabu_memory, iter
     )
-    swaps = get_swaps(
-        solution, family_idx, k,
-        tabu_list, iter
+    swaps, swap_hashes = get_swaps(
+        problem, solution, solution_hash, family_idx, neighbors,
+        tabu_memory, iter
     )
     moves = shifts + swaps
-
-    moves_scores = computes_total_costs(moves)
+    if len(moves) == 0:
+        return solution, np.inf, solution_hash, 0
+
+    moves_hashes = shift_hashes + swap_hashes
+    if fitness_cache is None:
+        moves_scores = computes_total_costs(problem, moves)
+    else:
+        moves_scores = fitness_cache.total_costs(moves, moves_hashes)
     best_move_arg = np.argmin(moves_scores)
     best_move = moves[best_move_arg]
     best_move_score = moves_scores[best_move_arg]
+    best_move_hash = moves_hashes[best_move_arg]
 
-    return best_move, best_move_score, len(moves)
+    return best_move, best_move_score, best_move_hash, len(moves)
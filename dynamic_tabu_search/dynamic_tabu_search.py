@@ -1,8 +1,11 @@
-import numpy as np
-
+from checkpoints import Checkpoint
 from dynamic_tabu_search.dynamic_neighborhood import DynamicNeighborhood
+from dynamic_tabu_search.tabu_memory import TabuMemory
 
+from fitness_cache import FitnessCache
+from load_data_and_constants import as_solution
 from metrics import computes_total_costs
+from telemetry import NULL_RECORDER
 
 # From:
 # A dynamic tabu search for large-scale generalised assignment problems
@@ -10,56 +13,144 @@ from metrics import computes_total_costs
 
 
 class DynamicTabuSearch():
-    def __init__(self, initial_solution):
+    STATS_FIELDS = ('iter', 'score', 'best_score')
+
+    def __init__(self, problem, initial_solution, checkpoint_path=None,
+                 recorder=NULL_RECORDER, fitness_cache_size=None):
+        """
+        :param checkpoint_path: directory where the state of the search is
+                                saved after each local search, and from
+                                which run resumes (see checkpoints.Checkpoint).
+        :param recorder: records iterations and phase times
+                         (see telemetry.Recorder), nothing by default.
+        :param fitness_cache_size: number of scored neighbors kept so that
+                                   they are not evaluated again
+                                   (see fitness_cache.FitnessCache). None
+                                   by default: the tabu list keeps the
+                                   search from revisiting solutions, so
+                                   the cache hardly ever hits. Its hits
+                                   and misses are counted by recorder.
+        """
+        self.problem = problem
         self.n_families = initial_solution.shape[0]
-        self.n_days = initial_solution.max() + 1
-        self.best_score = computes_total_costs([initial_solution])[0]
+        self.n_days = problem.n_days
+        # Solutions are kept in the compact type of the problem
+        initial_solution = as_solution(problem, initial_solution)
+        self.best_score = computes_total_costs(problem, [initial_solution])[0]
         self.best_solution = initial_solution.copy()
-        self.solution = initial_solution.copy()
+        self.solution = initial_solution
         self.iter = 0
-        self.initialize_tabu_list()
+        self.recorder = recorder
+        self.n_local_searches = 0
+        self.fitness_cache_size = fitness_cache_size
+        self.checkpoint = None if checkpoint_path is None else \
+            Checkpoint(checkpoint_path, self.STATS_FIELDS)
 
     def local_search(self):
         i = 0
         self.solution = self.best_solution
+        self.solution_hash = self.best_solution_hash
         while i <= self.n_iter_without_improvement:
-            neighbor, neighbor_score = self.dn.get_neighbor(
-                self.solution
-            )
+            with self.recorder.phase('evaluation'):
+                neighbor, neighbor_score, neighbor_hash, n_moves = \
+                    self.dn.get_neighbor(self.solution, self.solution_hash)
 
             self.solution = neighbor.copy()
-            self.update_tabu_list(neighbor)
+            self.solution_hash = neighbor_hash
+            self.update_tabu_list(neighbor_hash)
 
-            print(f'Iteration {self.iter} - Score: {neighbor_score}')
-            if self.iter % 50 == 0:
-                self.save_solution()
+            self.recorder.record(self.iter, neighbor_score,
+                                 min(neighbor_score, self.best_score),
+                                 n_moves)
+            if self.checkpoint is not None:
+                self.checkpoint.append_stats(
+                    self.iter, neighbor_score,
+                    min(neighbor_score, self.best_score)
+                )
             self.iter += 1
             i += 1
 
             if neighbor_score < self.best_score:
                 self.best_solution = neighbor.copy()
                 self.best_score = neighbor_score
+                self.best_solution_hash = neighbor_hash
                 break
 
-    def update_tabu_list(self, new_solution):
-        self.tabu_list = np.hstack([self.tabu_list, new_solution])
-        l = self.tabu_list.shape[1]
-        self.tabu_list = self.tabu_list[:, min(l, self.tabu_duration)]
+    def update_tabu_list(self, new_solution_hash):
+        self.tabu_memory.add(new_solution_hash)
 
     def initialize_tabu_list(self):
-        self.tabu_list = self.best_solution.reshape((-1, 1))
+        """The tabu list holds the hashes of the last tabu_duration
+        visited solutions (see tabu_memory.TabuMemory).
+        """
+        self.tabu_memory = TabuMemory(self.n_families, self.n_days,
+                                      self.tabu_duration)
+        self.best_solution_hash = self.tabu_memory.hash(self.best_solution)
+        self.tabu_memory.add(self.best_solution_hash)
+        # Keyed by the hashes of the tabu memory, which the neighborhood
+        # derives for every move
+        self.fitness_cache = None if self.fitness_cache_size is None else \
+            FitnessCache(self.problem, self.fitness_cache_size,
+                         keys=self.tabu_memory.keys)
+
+    def save_checkpoint(self):
+        if self.checkpoint is None:
+            return
+        self.checkpoint.save(
+            arrays={
+                'solution': self.solution,
+                'best_solution': self.best_solution,
+                'tabu_ring': self.tabu_memory.ring
+            },
+            values={
+                'best_score': float(self.best_score),
+                'best_solution_hash': self.best_solution_hash,
+                'iter': self.iter,
+                'n_local_searches': self.n_local_searches,
+                'n_tabu_hashes': self.tabu_memory.n_hashes
+            }
+        )
+
+    def resume(self):
+        """Restores the state of the last checkpoint.
+
+        :return: False if there is no checkpoint.
+        """
+        state = None if self.checkpoint is None else self.checkpoint.load()
+        if state is None:
+            return False
+        arrays, values = state
+        self.solution = as_solution(self.problem, arrays['solution'])
+        self.best_solution = as_solution(self.problem,
+                                         arrays['best_solution'])
+        self.tabu_memory.restore(arrays['tabu_ring'],
+                                 values['n_tabu_hashes'])
+        self.best_score = values['best_score']
+        self.best_solution_hash = values['best_solution_hash']
+        self.iter = values['iter']
+        self.n_local_searches = values['n_local_searches']
+        return True
 
     def run(self, iter_max, neighborhood_size, family_neighbor_size,
             tabu_duration, n_iter_without_improvement):
         self.tabu_duration = tabu_duration
+        self.initialize_tabu_list()
         self.n_iter_without_improvement = n_iter_without_improvement
         self.dn = DynamicNeighborhood(
             self, neighborhood_size,
             family_neighbor_size
         )
-        print(f'Initial score: {self.best_score}')
-        for i in range(iter_max):
-            self.local_search()
-
-    def save_solution(self):
-        np.save('data/best_solution_ts.npy', self.best_solution)
+        if self.resume():
+            print(f'Resumed at iteration {self.iter} - '
+                  f'Best score: {self.best_score}')
+        else:
+            print(f'Initial score: {self.best_score}')
+        for i in range(self.n_local_searches, iter_max):
+            with self.recorder.phase('local_search'):
+                self.local_search()
+            self.n_local_searches = i + 1
+            self.save_checkpoint()
+        if self.fitness_cache is not None:
+            self.recorder.count('fitness_cache_hits', self.fitness_cache.hits)
+            self.recorder.count('fitness_cache_misses',
+                                self.fitness_cache.misses)
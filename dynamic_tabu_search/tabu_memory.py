@@ -0,0 +1,91 @@
+from numba import njit
+import numpy as np
+
+
+@njit(cache=True)
+def solution_hash(keys, solution):
+    """Zobrist hash of solution: xor of the keys of its assignments."""
+    h = np.uint64(0)
+    for family_idx in range(len(solution)):
+        h ^= keys[family_idx, solution[family_idx]]
+    return h
+
+
+@njit(cache=True)
+def population_hashes(keys, population):
+    """Zobrist hash of each individual of population."""
+    hashes = np.empty(len(population), dtype=np.uint64)
+    for i in range(len(population)):
+        hashes[i] = solution_hash(keys, population[i])
+    return hashes
+
+
+def zobrist_keys(n_families, n_days, seed=0):
+    """Random key of each assignment of a family to a day (see
+    solution_hash).
+    """
+    rng = np.random.default_rng(seed)
+    return rng.integers(np.iinfo(np.uint64).max,
+                        size=(n_families, n_days + 1),
+                        dtype=np.uint64, endpoint=True)
+
+
+class TabuMemory():
+    """Tabu list of the last tenure visited solutions, stored as Zobrist
+    hashes in a ring buffer, with a hash table of the hashes it contains.
+    Hashes of neighbors are derived from the hash of the current solution
+    in constant time, so checks and updates do not depend on the tenure
+    nor on the number of families.
+    """
+
+    def __init__(self, n_families, n_days, tenure, seed=0):
+        self.keys = zobrist_keys(n_families, n_days, seed)
+        self.tenure = max(tenure, 1)
+        self.ring = np.zeros(self.tenure, dtype=np.uint64)
+        self.n_hashes = 0
+        # Number of occurrences of each hash in the ring buffer, a solution
+        # can be visited several times within the tenure.
+        self.counts = {}
+
+    def hash(self, solution):
+        return int(solution_hash(self.keys, solution))
+
+    def move_hash(self, h, solution, family_idx, new_choice, swap_idx=-1):
+        """Hash of solution (whose hash is h) after moving family_idx to
+        new_choice, and swap_idx to the current choice of family_idx if it
+        is a swap.
+        """
+        current_choice = solution[family_idx]
+        h ^= int(self.keys[family_idx, current_choice]) ^ \
+            int(self.keys[family_idx, new_choice])
+        if swap_idx >= 0:
+            h ^= int(self.keys[swap_idx, new_choice]) ^ \
+                int(self.keys[swap_idx, current_choice])
+        return h
+
+    def __contains__(self, h):
+        return h in self.counts
+
+    def add(self, h):
+        """Makes h tabu, releasing the oldest hash once the tenure is
+        reached.
+        """
+        position = self.n_hashes % self.tenure
+        if self.n_hashes >= self.tenure:
+            released = int(self.ring[position])
+            self.counts[released] -= 1
+            if self.counts[released] == 0:
+                del self.counts[released]
+        self.ring[position] = h
+        self.counts[h] = self.counts.get(h, 0) + 1
+        self.n_hashes += 1
+
+    def restore(self, ring, n_hashes):
+        """Restores the hashes of a saved ring buffer (see ring and
+        n_hashes attributes).
+        """
+        self.ring[:] = ring
+        self.n_hashes = n_hashes
+        self.counts = {}
+        for h in self.ring[:min(n_hashes, self.tenure)]:
+            self.counts[int(h)] = self.counts.get(int(h), 0) + 1
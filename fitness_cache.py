@@ -0,0 +1,80 @@
+from collections import OrderedDict
+
+import numpy as np
+
+from dynamic_tabu_search.tabu_memory import population_hashes, zobrist_keys
+from metrics import computes_total_costs
+
+MAX_SIZE = 100000
+
+
+class FitnessCache():
+    """Bounded cache of the total costs of solutions in front of
+    metrics.computes_total_costs, keyed by the Zobrist hash of the
+    solutions (see tabu_memory.solution_hash). It is used by the dynamic
+    tabu search, which maintains the hashes of its moves incrementally (see
+    TabuMemory.move_hash, with the same keys) and gives them, so that a hit
+    costs a dictionary lookup. Beyond max_size solutions, the least
+    recently used ones are evicted.
+
+    Two solutions with the same 64 bits hash would share their costs,
+    which is unlikely enough to be ignored.
+    """
+
+    def __init__(self, problem, max_size=MAX_SIZE, keys=None, seed=0):
+        """
+        :param keys: Zobrist keys of the hashes (see
+                     tabu_memory.zobrist_keys), e.g. those of a TabuMemory,
+                     drawn from seed if None.
+        """
+        self.problem = problem
+        self.max_size = max_size
+        self.keys = zobrist_keys(len(problem.family_size), problem.n_days,
+                                 seed) if keys is None else keys
+        # Total cost of each hash, from the least recently used
+        self.entries = OrderedDict()
+        # Solutions whose costs were found in the cache (or earlier in the
+        # same call) and solutions evaluated
+        self.hits = 0
+        self.misses = 0
+
+    def hashes(self, population):
+        return [int(h) for h in population_hashes(self.keys, population)]
+
+    def total_costs(self, population, hashes=None):
+        """Same as metrics.computes_total_costs, the individuals missing
+        from the cache being evaluated in a single call.
+
+        :param hashes: hash of each individual, computed if None.
+        """
+        population = np.asarray(population)
+        if hashes is None:
+            hashes = self.hashes(population)
+        entries = self.entries
+        results = np.zeros(len(population))
+        missing = {}
+        for i, h in enumerate(hashes):
+            if h in entries:
+                entries.move_to_end(h)
+                results[i] = entries[h]
+                self.hits += 1
+            elif h in missing:
+                missing[h].append(i)
+                self.hits += 1
+            else:
+                missing[h] = [i]
+                self.misses += 1
+        if missing:
+            missing_costs = computes_total_costs(
+                self.problem,
+                population[[idx[0] for idx in missing.values()]]
+            )
+            for (h, idx), cost in zip(missing.items(), missing_costs):
+                entries[h] = float(cost)
+                results[idx] = cost
+            while len(entries) > self.max_size:
+                entries.popitem(last=False)
+        return results
+
+    def __len__(self):
+        return len(self.entries)
@@ -3,40 +3,54 @@ import numpy as np
 
 from metrics import (violation_score_variation,
                      compute_daily_occupancy)
-from load_data_and_constants import cost_matrix, family_size
 
 
-@njit
-def update_daily_occupancy(idx, choice_parent, choice_offspring, daily_occ):
-    n = family_size[idx]
+@njit(cache=True)
+def update_daily_occupancy(problem, idx, choice_parent, choice_offspring,
+                           daily_occ):
+    n = problem.family_size[idx]
     daily_occ[choice_parent - 1] -= n
     daily_occ[choice_offspring - 1] += n
     return daily_occ
 
 
-@njit
-def gap_crossovers(population, uniform_rate):
+@njit(cache=True)
+def gap_crossovers(problem, population, uniform_rate, offsprings,
+                   parents_idx, changed):
+    """Writes in place two offsprings per pair of random parents of
+    population, until offsprings is full.
+
+    :param offsprings: 2D array of offsprings, written in place
+    :param parents_idx: written with the index in population of the parent
+                        of each offspring
+    :param changed: written with, for each offspring, the mask of the
+                    families whose choice differs from its parent.
+    """
     parents1 = np.arange(len(population))
     parents2 = np.arange(len(population))
     np.random.shuffle(parents1)
     np.random.shuffle(parents2)
+    crossover_positions = np.arange(population.shape[1])
+    changed[:] = False
 
-    output = [population[0]]
-
-    for p1, p2 in zip(parents1, parents2):
-        offspring1 = population[p1]
-        offspring2 = population[p2]
+    for k in range(len(offsprings) // 2):
+        p1 = parents1[k % len(population)]
+        p2 = parents2[k % len(population)]
+        offspring1 = offsprings[2 * k]
+        offspring2 = offsprings[2 * k + 1]
+        offspring1[:] = population[p1]
+        offspring2[:] = population[p2]
+        parents_idx[2 * k] = p1
+        parents_idx[2 * k + 1] = p2
 
-        daily_occ1 = compute_daily_occupancy(offspring1)
-        daily_occ2 = compute_daily_occupancy(offspring2)
+        daily_occ1 = compute_daily_occupancy(problem, offspring1)
+        daily_occ2 = compute_daily_occupancy(problem, offspring2)
 
         n_crossovers = np.random.randint(population.shape[1] + 1)
-        crossover_positions = np.arange(population.shape[1])
         np.random.shuffle(crossover_positions)
-        crossover_positions = crossover_positions[:n_crossovers]
 
         p = np.random.random()
-        for idx in crossover_positions:
+        for idx in crossover_positions[:n_crossovers]:
             choice_parent1 = offspring1[idx]
             choice_parent2 = offspring2[idx]
             choice_offspring1 = choice_parent2
@@ -46,14 +60,16 @@ def gap_crossovers(population, uniform_rate):
                 offspring2[idx] = choice_offspring2
             else:
                 viol_score_parent1, violation_score1 = violation_score_variation(
-                    idx, choice_parent1, choice_offspring1, daily_occ1
+                    problem, idx, choice_parent1, choice_offspring1,
+                    daily_occ1
                 )
                 viol_score_parent2, violation_score2 = violation_score_variation(
-                    idx, choice_parent2, choice_offspring2, daily_occ2
+                    problem, idx, choice_parent2, choice_offspring2,
+                    daily_occ2
                 )
 
-                occupancy_cost1 = cost_matrix[idx, choice_offspring1-1]
-                occupancy_cost2 = cost_matrix[idx, choice_offspring2-1]
+                occupancy_cost1 = problem.cost_matrix[idx, choice_offspring1-1]
+                occupancy_cost2 = problem.cost_matrix[idx, choice_offspring2-1]
 
                 if (violation_score1 == 0 & violation_score2 == 0) & \
                    (occupancy_cost1 < occupancy_cost2):
@@ -68,12 +84,12 @@ def gap_crossovers(population, uniform_rate):
                     choice_offspring2 = choice_parent2
 
             daily_occ1 = update_daily_occupancy(
-                idx, choice_parent1, choice_offspring1, daily_occ1
+                problem, idx, choice_parent1, choice_offspring1, daily_occ1
             )
             daily_occ2 = update_daily_occupancy(
-                idx, choice_parent2, choice_offspring2, daily_occ2
+                problem, idx, choice_parent2, choice_offspring2, daily_occ2
             )
-
-        output += [offspring1, offspring2]
-
-    return output
\ No newline at end of file
+            # Both offsprings change where the exchanged choices differ
+            if choice_offspring1 != choice_parent1:
+                changed[2 * k, idx] = True
+                changed[2 * k + 1, idx] = True
@@ -0,0 +1,212 @@
+import argparse
+from multiprocessing import get_context
+import os
+import queue
+
+import numpy as np
+
+from initializations import initialise_population
+from genetic_algoritms.main import (N, N_GENERATIONS, GenerationBuffers,
+                                    population_costs, next_generation)
+from load_data_and_constants import attach_problem, get_problem, share_problem
+from metrics import computes_total_costs, parallel_computes_daily_states
+from telemetry import NULL_RECORDER, Recorder
+from utils import seed_compiled_functions, set_n_threads
+
+N_ISLANDS = 4
+MIGRATION_INTERVAL = 20
+N_MIGRANTS = 5
+TOPOLOGY = 'ring'
+N_THREADS_PER_ISLAND = 1
+# Seconds between two checks that the islands are still running while
+# waiting for their results
+POLL_INTERVAL = 1.
+LOG_DIR = 'data/logs/islands'
+
+
+def migration_targets(n_islands, topology):
+    """Islands receiving the migrants of each island.
+
+    :param topology: 'ring' (to the next island) or 'full' (to all others)
+    """
+    if topology == 'ring':
+        return [[(i + 1) % n_islands] for i in range(n_islands)]
+    if topology == 'full':
+        return [[j for j in range(n_islands) if j != i]
+                for i in range(n_islands)]
+    raise ValueError(f'Unknown migration topology: {topology}')
+
+
+def migrate(problem, population, daily_states, total_costs, immigrants):
+    """Replaces the worst individuals of population by immigrants. With
+    more immigrants than individuals (e.g. from every other island of a
+    full topology), only the best immigrants are accepted.
+    """
+    n_slots = min(len(immigrants), len(population))
+    if len(immigrants) > n_slots:
+        immigrants = immigrants[
+            np.argsort(computes_total_costs(problem, immigrants))[:n_slots]
+        ]
+    worst_idx = np.argsort(total_costs)[::-1][:n_slots]
+    population[worst_idx] = immigrants
+    immigrants_states = parallel_computes_daily_states(problem, immigrants)
+    for state, immigrants_state in zip(daily_states, immigrants_states):
+        state[worst_idx] = immigrants_state
+
+
+def evolve_island(island_idx, descriptors, seed, n_individuals,
+                  n_generations, migration_interval, n_migrants, targets,
+                  n_sources, inboxes, results, n_threads, log_dir):
+    """Evolves the population of one island in a worker process. Every
+    migration_interval generations, its n_migrants best individuals are sent
+    to the inboxes of targets and as many are received from each of its
+    n_sources source islands. Immigrants are taken in the order of their
+    source islands, whatever the order they arrive in, so that a seeded
+    run is reproducible.
+
+    :param log_dir: if given, the generations of the island are recorded
+                    in island_<island_idx>.jsonl there
+                    (see telemetry.Recorder).
+    """
+    problem, blocks = attach_problem(descriptors)
+    set_n_threads(n_threads)
+    np.random.seed(seed)
+    seed_compiled_functions(seed)
+    recorder = NULL_RECORDER if log_dir is None else Recorder(
+        log_path=os.path.join(log_dir, f'island_{island_idx}.jsonl')
+    )
+    buffers = GenerationBuffers(problem, n_individuals)
+    buffers.load(problem, initialise_population(problem, n_individuals))
+    best_scores = []
+    for n in range(n_generations):
+        with recorder.phase('evaluation'):
+            total_costs = population_costs(problem, buffers)[-1]
+        best_scores.append(np.min(total_costs))
+        recorder.record(n, best_scores[-1], min(best_scores), buffers.size)
+        if (n + 1) % migration_interval == 0:
+            with recorder.phase('migration'):
+                emigrants = buffers.population[
+                    np.argsort(total_costs)[:n_migrants]
+                ]
+                for target in targets:
+                    inboxes[target].put((island_idx, emigrants))
+                batches = sorted((inboxes[island_idx].get()
+                                  for _ in range(n_sources)),
+                                 key=lambda batch: batch[0])
+                immigrants = np.vstack([batch[1] for batch in batches])
+                migrate(problem, buffers.population, buffers.daily_states,
+                        total_costs, immigrants)
+                population_costs(problem, buffers)
+        next_generation(problem, buffers, recorder=recorder)
+    total_costs = population_costs(problem, buffers)[-1]
+    best_idx = np.argmin(total_costs)
+    results.put((island_idx, buffers.population[best_idx],
+                 total_costs[best_idx], best_scores))
+    recorder.close()
+    for block in blocks:
+        block.close()
+
+
+def island_model(n_islands=N_ISLANDS, n_individuals=N,
+                 n_generations=N_GENERATIONS,
+                 migration_interval=MIGRATION_INTERVAL,
+                 n_migrants=N_MIGRANTS, topology=TOPOLOGY,
+                 n_threads=N_THREADS_PER_ISLAND, seed=0, problem=None,
+                 log_dir=None):
+    """Evolves n_islands populations of n_individuals in parallel worker
+    processes, exchanging their best individuals every migration_interval
+    generations along topology (see migration_targets). The problem arrays
+    are shared with the islands (see load_data_and_constants.share_problem).
+
+    :param n_threads: threads of the parallel kernels in each island.
+    :param seed: island i is seeded with seed + i.
+    :param log_dir: directory of the telemetry log of each island, none
+                    if None (see evolve_island).
+    :return: best individual, its score and the best score of each island
+             at every generation.
+    """
+    problem = get_problem() if problem is None else problem
+    targets = migration_targets(n_islands, topology)
+    n_sources = [sum(i in island_targets for island_targets in targets)
+                 for i in range(n_islands)]
+    context = get_context()
+    inboxes = [context.Queue() for _ in range(n_islands)]
+    results = context.Queue()
+    blocks, descriptors = share_problem(problem)
+    islands = []
+    try:
+        islands = [
+            context.Process(target=evolve_island, args=(
+                i, descriptors, seed + i, n_individuals, n_generations,
+                migration_interval, n_migrants, targets[i], n_sources[i],
+                inboxes, results, n_threads, log_dir
+            ))
+            for i in range(n_islands)
+        ]
+        for island in islands:
+            island.start()
+        # Results are read before joining: a process does not terminate
+        # while its queued data is not consumed.
+        islands_results = []
+        while len(islands_results) < n_islands:
+            try:
+                islands_results.append(results.get(timeout=POLL_INTERVAL))
+            except queue.Empty:
+                failed = [(i, island.exitcode)
+                          for i, island in enumerate(islands)
+                          if island.exitcode not in (None, 0)]
+                if failed:
+                    raise RuntimeError(f'Island processes exited with '
+                                       f'(island, exit code) {failed}')
+        islands_results.sort()
+        for island in islands:
+            island.join()
+    finally:
+        # Islands still running after a failure wait for the migrants of
+        # the failed ones.
+        for island in islands:
+            if island.is_alive():
+                island.terminate()
+        for block in blocks:
+            block.close()
+            block.unlink()
+    best_island = min(islands_results, key=lambda result: result[2])
+    best_scores = np.array([result[3] for result in islands_results])
+    return best_island[1], best_island[2], best_scores
+
+
+def reproducible(n_runs=2, **kwargs):
+    """Runs island_model n_runs times with the same kwargs (and seed).
+
+    :return: True if the runs give the same best individual and the same
+             best scores.
+    """
+    runs = [island_model(**kwargs) for _ in range(n_runs)]
+    best_individual, _, best_scores = runs[0]
+    return all(np.array_equal(run[0], best_individual) and
+               np.array_equal(run[2], best_scores) for run in runs[1:])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Evolves populations on islands exchanging migrants.'
+    )
+    parser.add_argument('--topology', default=TOPOLOGY,
+                        choices=('ring', 'full'))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--check-reproducible', action='store_true',
+                        help='only checks that two short seeded runs give '
+                             'the same results')
+    args = parser.parse_args()
+
+    if args.check_reproducible:
+        print('Reproducible:', reproducible(
+            n_individuals=50, n_generations=3 * MIGRATION_INTERVAL,
+            topology=args.topology, seed=args.seed
+        ))
+    else:
+        best_individual, best_score, best_scores = island_model(
+            topology=args.topology, seed=args.seed, log_dir=LOG_DIR
+        )
+        print(f'Best score: {best_score}')
+        np.save('data/best_solution_islands.npy', best_individual)
@@ -1,51 +1,259 @@
 from matplotlib import pyplot as plt
 import numpy as np
 
-from initializations import initialise_population
-from genetic_algoritms.selections import tournament, uniform_selection
+from initializations import (generate_relaxed_individual,
+                             initialise_population)
+from genetic_algoritms.selections import select, selection_fitness
 from genetic_algoritms.crossovers import gap_crossovers
 from genetic_algoritms.mutations import gap_mutations
-from metrics import computes_occ_acc_costs
+from genetic_algoritms.repairs import repair_offsprings
+from genetic_algoritms.nsgaII.archive import ParetoArchive
+from genetic_algoritms.nsgaII.selection import environment_selection_idx
+from metrics import (parallel_computes_daily_states,
+                     parallel_penalize_daily_costs,
+                     parallel_update_daily_states)
+from load_data_and_constants import get_problem
+from checkpoints import CHECKPOINT_DIR, Checkpoint
+from telemetry import NULL_RECORDER, Recorder
+from utils import set_n_threads
 
 N = 500
 N_GENERATIONS = 5000
 UNIFORM_CROSSOVER_RATE = 0.5
 SELECTION_RATE = 0.5
-ELITISM_RATE = 1
-MUTATION_RATE = 1
-RANDOM_FAMILY_RATE = 1
+ELITISM_RATE = 1.
+MUTATION_RATE = 1.
+RANDOM_FAMILY_RATE = 1.
 RANDOM_CHOICE_RATE = 0.5
 STEP_MUTATION_RATE = 0.5
 N_OPPONENTS = 2
+# Selection of the parents among the survivors, on their NSGA-II fitness
+# (see selections.select and selections.selection_fitness)
+SELECTION = 'tournament'
+SELECTION_OPTIONS = {'n_opponents': N_OPPONENTS}
+N_THREADS = None  # All cores
+CHECKPOINT_PATH = f'{CHECKPOINT_DIR}/ga'
+CHECKPOINT_INTERVAL = 20
+LOG_PATH = 'data/logs/ga.jsonl'
+STATS_FIELDS = ('generation', 'min_occ_cost', 'min_acc_cost',
+                'min_total_cost', 'median_total_cost', 'hypervolume')
+# Non-dominated individuals kept across generations
+# (see nsgaII.archive.ParetoArchive)
+ARCHIVE_SIZE = 200
 
-# population = np.load('data/population_nsga.npy', allow_pickle=True)
-population = initialise_population(N)
-offsprings = []
-
-for n in range(N_GENERATIONS):
-    combined_population = np.array(population.tolist() + offsprings)
-    occ_costs, acc_costs = computes_occ_acc_costs(combined_population)
-    costs_array = np.vstack([occ_costs.sum(axis=1), acc_costs.sum(axis=1)]).T
-    total_costs = costs_array.sum(axis=1)
-    print(
-        f'Generation {n}: \n min_occ_cost: {np.min(costs_array[:, 0])}' +
-        f' - min_acc_cost: {np.min(costs_array[:, 1])}' +
-        f' - min_total_cost: {np.min(total_costs)}' +
-        f' - median_total_cost: {np.median(total_costs)}'
-    )
-    if n % 20 == 0:
-        print('Saving population')
-        np.save('data/population_nsga.npy',
-                population, allow_pickle=True)
-    # Elitism
-    population = uniform_selection(combined_population, total_costs, N)
+
+def population_costs(problem, buffers):
+    """Penalized daily costs of buffers.population from its daily states,
+    written in the current cost buffers (see GenerationBuffers.costs).
+
+    :return: daily occupancy costs, daily accounting costs, the array of
+             (occupancy cost, accounting cost) of each individual and their
+             total costs.
+    """
+    costs = buffers.costs
+    parallel_penalize_daily_costs(problem, *buffers.daily_states, *costs)
+    return costs
+
+
+def daily_states_buffers(problem, n_individuals):
+    """Arrays of the daily states of n_individuals
+    (see metrics.computes_daily_states).
+    """
+    n_days = problem.n_days
+    return (np.zeros((n_individuals, n_days + 1),
+                     dtype=problem.family_size.dtype),
+            np.zeros((n_individuals, n_days)),
+            np.zeros((n_individuals, n_days)))
+
+
+def costs_buffers(problem, n_individuals):
+    """Arrays of the penalized costs of n_individuals
+    (see metrics.parallel_penalize_daily_costs).
+    """
+    n_days = problem.n_days
+    return (np.zeros((n_individuals, n_days)),
+            np.zeros((n_individuals, n_days)),
+            np.zeros((n_individuals, 2)),
+            np.zeros(n_individuals))
+
+
+class GenerationBuffers():
+    """Preallocated arrays of the generation loop, so that no
+    population-sized array is allocated once it runs: two populations
+    (survivors followed by their offsprings) with their daily states and
+    penalized costs, swapped every generation, the parents drawn from the
+    survivors with their daily states, and the families changed in each
+    offspring.
+    Individuals and occupancies are in the compact types of problem
+    (see load_data_and_constants.compact_arrays).
+    """
+
+    def __init__(self, problem, n_survivors=N):
+        n_families = len(problem.family_size)
+        self.n_survivors = n_survivors
+        self.n_offsprings = 2 * n_survivors
+        capacity = n_survivors + self.n_offsprings
+        self.populations = [
+            np.zeros((capacity, n_families), dtype=problem.data_array.dtype)
+            for _ in range(2)
+        ]
+        self.states = [daily_states_buffers(problem, capacity)
+                       for _ in range(2)]
+        self.costs_buffers = [costs_buffers(problem, capacity)
+                              for _ in range(2)]
+        self.parents = np.zeros((n_survivors, n_families),
+                                dtype=problem.data_array.dtype)
+        self.parents_states = daily_states_buffers(problem, n_survivors)
+        self.parents_idx = np.zeros(self.n_offsprings, dtype=np.int64)
+        self.changed = np.zeros((self.n_offsprings, n_families),
+                                dtype=np.bool_)
+        self.current = 0
+        self.size = 0
+
+    @property
+    def population(self):
+        return self.populations[self.current][:self.size]
+
+    @property
+    def daily_states(self):
+        return tuple(state[:self.size] for state in self.states[self.current])
+
+    @property
+    def costs(self):
+        """Penalized costs of population, as given by population_costs."""
+        return tuple(costs[:self.size]
+                     for costs in self.costs_buffers[self.current])
+
+    def load(self, problem, population):
+        """Copies population in the current buffers and computes its daily
+        states.
+        """
+        if len(population) > len(self.populations[self.current]):
+            raise ValueError(f'Population of {len(population)} individuals '
+                             f'larger than the buffers')
+        self.size = len(population)
+        self.populations[self.current][:self.size] = population
+        daily_states = parallel_computes_daily_states(problem, population)
+        for buffer, state in zip(self.states[self.current], daily_states):
+            buffer[:self.size] = state
+
+
+def next_generation(problem, buffers, recorder=NULL_RECORDER):
+    """Keeps the buffers.n_survivors best individuals of buffers.population
+    (see nsgaII.selection.environment_selection) and appends the offsprings
+    of parents selected on their front number then crowding distance among
+    them, in the other population buffers which then become the current
+    ones. Daily states follow the population (see
+    metrics.update_daily_states). The costs of buffers.population must
+    have been computed by population_costs.
+
+    :param buffers: see GenerationBuffers
+    :param recorder: records the time of each operation
+                     (see telemetry.Recorder)
+    """
+    population = buffers.population
+    daily_states = buffers.daily_states
+    occ_costs, acc_costs, costs_array, _ = buffers.costs
+    next_population = buffers.populations[1 - buffers.current]
+    next_states = buffers.states[1 - buffers.current]
+    with recorder.phase('selection'):
+        # Elitism
+        selection_idx, ranks, crowd_dis = environment_selection_idx(
+            costs_array, buffers.n_survivors
+        )
+        n_survivors = len(selection_idx)
+        np.take(population, selection_idx, axis=0,
+                out=next_population[:n_survivors])
+        for state, next_state in zip(daily_states, next_states):
+            np.take(state, selection_idx, axis=0,
+                    out=next_state[:n_survivors])
+        winners = select(selection_fitness(ranks, crowd_dis),
+                         buffers.n_survivors, SELECTION, **SELECTION_OPTIONS)
+        np.take(next_population, winners, axis=0, out=buffers.parents)
+        for next_state, parents_state in zip(next_states,
+                                             buffers.parents_states):
+            np.take(next_state, winners, axis=0, out=parents_state)
 
     # Genetic operations
-    parents = tournament(population, total_costs, SELECTION_RATE, N_OPPONENTS)
-    offsprings = gap_crossovers(parents, UNIFORM_CROSSOVER_RATE)
-    del offsprings[-1]
-    offsprings = gap_mutations(offsprings, MUTATION_RATE,
-                               RANDOM_FAMILY_RATE,
-                               RANDOM_CHOICE_RATE,
-                               STEP_MUTATION_RATE,
-                               occ_costs, acc_costs)
+    offsprings = next_population[n_survivors:
+                                 n_survivors + buffers.n_offsprings]
+    with recorder.phase('crossover'):
+        gap_crossovers(problem, buffers.parents, UNIFORM_CROSSOVER_RATE,
+                       offsprings, buffers.parents_idx, buffers.changed)
+    with recorder.phase('mutation'):
+        _, mutated_families = gap_mutations(problem, offsprings,
+                                            MUTATION_RATE,
+                                            RANDOM_FAMILY_RATE,
+                                            RANDOM_CHOICE_RATE,
+                                            STEP_MUTATION_RATE,
+                                            occ_costs, acc_costs)
+        mutated = np.nonzero(mutated_families >= 0)[0]
+        buffers.changed[mutated, mutated_families[mutated]] = True
+    with recorder.phase('repair'):
+        repair_offsprings(problem, offsprings, buffers.parents,
+                          buffers.parents_idx, buffers.changed,
+                          buffers.parents_states[0])
+    with recorder.phase('evaluation'):
+        parallel_update_daily_states(
+            problem, offsprings, buffers.parents, buffers.parents_idx,
+            buffers.changed, *buffers.parents_states,
+            *(state[n_survivors:n_survivors + buffers.n_offsprings]
+              for state in next_states)
+        )
+    buffers.current = 1 - buffers.current
+    buffers.size = n_survivors + buffers.n_offsprings
+
+
+if __name__ == '__main__':
+    set_n_threads(N_THREADS)
+    problem = get_problem()
+    checkpoint = Checkpoint(CHECKPOINT_PATH, STATS_FIELDS)
+    recorder = Recorder(log_path=LOG_PATH, print_every=1)
+    state = checkpoint.load()
+    # Created once the first generation is scored, its reference point
+    # being the worst costs of that generation
+    archive = None
+    if state is None:
+        start_generation = 0
+        population = initialise_population(
+            problem, N, seeds=[generate_relaxed_individual(problem)]
+        )
+    else:
+        arrays, values = state
+        start_generation = values['generation']
+        population = np.array(arrays['population'],
+                              dtype=problem.data_array.dtype)
+        if 'archive_costs' in arrays:
+            archive = ParetoArchive.from_state(arrays, ARCHIVE_SIZE)
+        print(f'Resumed at generation {start_generation}')
+    # Per-day occupancy and costs of each individual, kept along the
+    # population so that survivors are never re-scored and offsprings are
+    # scored from their parent (see metrics.update_daily_states).
+    buffers = GenerationBuffers(problem)
+    buffers.load(problem, population)
+
+    best_score = np.inf
+    n_offsprings = len(population)
+    for n in range(start_generation, N_GENERATIONS):
+        if n % CHECKPOINT_INTERVAL == 0:
+            checkpoint_arrays = {'population': buffers.population}
+            if archive is not None:
+                checkpoint_arrays.update(archive.state())
+            checkpoint.save(checkpoint_arrays, {'generation': n})
+        with recorder.phase('evaluation'):
+            _, _, costs_array, total_costs = population_costs(problem,
+                                                              buffers)
+        with recorder.phase('archive'):
+            if archive is None:
+                archive = ParetoArchive(costs_array.max(axis=0),
+                                        ARCHIVE_SIZE)
+            archive.update(buffers.population, costs_array)
+        best_score = min(best_score, np.min(total_costs))
+        recorder.record(n, np.min(total_costs), best_score, n_offsprings)
+        checkpoint.append_stats(n, np.min(costs_array[:, 0]),
+                                np.min(costs_array[:, 1]),
+                                np.min(total_costs), np.median(total_costs),
+                                archive.hypervolume)
+        next_generation(problem, buffers, recorder=recorder)
+        n_offsprings = buffers.n_offsprings
+    recorder.close()
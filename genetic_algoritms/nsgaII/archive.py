@@ -0,0 +1,169 @@
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+
+MAX_SIZE = 200
+
+
+class ParetoArchive():
+    """Bounded archive of the non-dominated solutions found so far on the
+    two objectives (occupancy cost, accounting cost), kept across
+    generations.
+
+    The members are sorted by increasing occupancy cost, hence by
+    decreasing accounting cost, so that a binary search finds whether a
+    solution is dominated and where it goes. The members it dominates are
+    contiguous after it, and each member is removed only once. When the
+    archive is full, the member of lowest crowding distance is evicted,
+    the two extreme members being kept. The hypervolume dominated within
+    the reference point is updated with each change, from the neighbors of
+    the members added or removed.
+    """
+
+    def __init__(self, reference_point, max_size=MAX_SIZE):
+        """
+        :param reference_point: (occupancy cost, accounting cost) bounding
+                                the hypervolume, e.g. the worst costs of
+                                the first population.
+        """
+        self.reference_point = tuple(float(cost) for cost in reference_point)
+        self.max_size = max_size
+        self.occ_costs = []
+        self.acc_costs = []
+        self.solutions = []
+        self.hypervolume = 0.
+
+    def __len__(self):
+        return len(self.occ_costs)
+
+    @property
+    def costs_array(self):
+        """2D array of the (occupancy cost, accounting cost) of the members,
+        by increasing occupancy cost.
+        """
+        return np.column_stack((self.occ_costs, self.acc_costs)) \
+            if len(self) > 0 else np.zeros((0, 2))
+
+    def dominated(self, occ_cost, acc_cost):
+        """True if a member is at least as good on both objectives."""
+        idx = bisect_right(self.occ_costs, occ_cost) - 1
+        return idx >= 0 and self.acc_costs[idx] <= acc_cost
+
+    def area(self, start, end, next_occ_cost):
+        """Hypervolume dominated by members start to end - 1 alone, up to
+        the occupancy cost next_occ_cost of the following member.
+        """
+        ref_occ_cost, ref_acc_cost = self.reference_point
+        occ_costs = self.occ_costs[start:end] + [next_occ_cost]
+        area = 0.
+        for i in range(end - start):
+            width = min(occ_costs[i + 1], ref_occ_cost) - \
+                min(occ_costs[i], ref_occ_cost)
+            area += max(0., width) * max(0., ref_acc_cost -
+                                         self.acc_costs[start + i])
+        return area
+
+    def next_occ_cost(self, idx):
+        """Occupancy cost of member idx, the reference one past the end."""
+        return self.occ_costs[idx] if idx < len(self) \
+            else self.reference_point[0]
+
+    def insert(self, occ_cost, acc_cost, solution):
+        """Adds solution unless it is dominated, removing the members it
+        dominates.
+
+        :return: True if solution was added.
+        """
+        if self.dominated(occ_cost, acc_cost):
+            return False
+        start = bisect_left(self.occ_costs, occ_cost)
+        end = start
+        while end < len(self) and self.acc_costs[end] >= acc_cost:
+            end += 1
+        # Hypervolume from the previous member to the next kept one
+        first = max(start - 1, 0)
+        self.hypervolume -= self.area(first, end, self.next_occ_cost(end))
+        self.occ_costs[start:end] = [occ_cost]
+        self.acc_costs[start:end] = [acc_cost]
+        self.solutions[start:end] = [solution.copy()]
+        self.hypervolume += self.area(first, start + 1,
+                                      self.next_occ_cost(start + 1))
+        return True
+
+    def crowding_distances(self):
+        """Crowding distance of each member, infinite for the extreme ones
+        (see evaluation.crowding_distance).
+        """
+        occ_costs = np.array(self.occ_costs)
+        acc_costs = np.array(self.acc_costs)
+        distances = np.full(len(self), np.inf)
+        occ_span = occ_costs[-1] - occ_costs[0]
+        acc_span = acc_costs[0] - acc_costs[-1]
+        if len(self) > 2 and occ_span > 0 and acc_span > 0:
+            distances[1:-1] = (occ_costs[2:] - occ_costs[:-2]) / occ_span + \
+                (acc_costs[:-2] - acc_costs[2:]) / acc_span
+        return distances
+
+    def evict(self):
+        """Removes the member of lowest crowding distance."""
+        idx = int(np.argmin(self.crowding_distances()))
+        first = max(idx - 1, 0)
+        self.hypervolume -= self.area(first, idx + 1,
+                                      self.next_occ_cost(idx + 1))
+        del self.occ_costs[idx]
+        del self.acc_costs[idx]
+        del self.solutions[idx]
+        self.hypervolume += self.area(first, idx, self.next_occ_cost(idx))
+
+    def update(self, population, costs_array):
+        """Inserts the individuals of population not dominated by the
+        archive, then evicts members down to max_size.
+
+        :param costs_array: (occupancy cost, accounting cost) of each
+                            individual
+        :return: number of individuals added.
+        """
+        n_added = 0
+        # Individuals dominated by the archive before the update are
+        # discarded at once.
+        candidates = np.arange(len(population))
+        if len(self) > 0:
+            idx = np.searchsorted(self.occ_costs, costs_array[:, 0],
+                                  side='right') - 1
+            dominated = (idx >= 0) & \
+                (np.array(self.acc_costs)[np.maximum(idx, 0)] <=
+                 costs_array[:, 1])
+            candidates = candidates[~dominated]
+        for i in candidates:
+            n_added += self.insert(float(costs_array[i, 0]),
+                                   float(costs_array[i, 1]), population[i])
+        while len(self) > self.max_size:
+            self.evict()
+        return n_added
+
+    def compute_hypervolume(self):
+        """Hypervolume recomputed from all the members."""
+        return self.area(0, len(self), self.reference_point[0])
+
+    def state(self):
+        """Arrays to save in a checkpoint (see from_state)."""
+        return {
+            'archive_reference_point': np.array(self.reference_point),
+            'archive_costs': self.costs_array,
+            'archive_solutions': np.array(self.solutions),
+            # Saved rather than recomputed, so that a resumed run goes on
+            # with the same hypervolume
+            'archive_hypervolume': np.array([self.hypervolume])
+        }
+
+    @classmethod
+    def from_state(cls, arrays, max_size=MAX_SIZE):
+        """Archive restored from the arrays of state."""
+        archive = cls(arrays['archive_reference_point'], max_size)
+        costs_array = arrays['archive_costs']
+        archive.occ_costs = [float(cost) for cost in costs_array[:, 0]]
+        archive.acc_costs = [float(cost) for cost in costs_array[:, 1]]
+        archive.solutions = [np.array(solution)
+                             for solution in arrays['archive_solutions']]
+        archive.hypervolume = float(arrays['archive_hypervolume'][0])
+        return archive
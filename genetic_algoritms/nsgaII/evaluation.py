@@ -2,7 +2,7 @@ from numba import njit
 import numpy as np
 
 
-@njit
+@njit(cache=True)
 def dominates(cost1: np.array, cost2: np.array) -> bool:
     """Returns True if individual1 dominates individual2,
        False otherwise.
@@ -16,53 +16,64 @@ def dominates(cost1: np.array, cost2: np.array) -> bool:
            (occ_cost1 < occ_cost2 or acc_cost1 < acc_cost2)
 
 
-@njit
+@njit(cache=True)
 def fast_non_dominated_sort(costs_array):
-    front_groups = []
-    ranks = np.zeros(len(costs_array))
-    dominated_lists = []
-    domination_counters = []
-    # First Front
-    first_front = []
-    for idx1 in range(len(costs_array)):
-        cost1 = costs_array[idx1]
-        dominated_list = []
-        domination_counter = 0
-        for idx2 in range(len(costs_array)):
-            cost2 = costs_array[idx2]
-            if dominates(cost1, cost2):
-                dominated_list.append(idx2)
-            elif dominates(cost2, cost1):
-                domination_counter += 1
-        dominated_lists.append(dominated_list)
-        domination_counters.append(domination_counter)
-        if domination_counters[idx1] == 0:
-            ranks[idx1] = 0
-            first_front.append(idx1)
-    front_groups.append(first_front)
+    """Pareto fronts of the two objectives costs, found by a sort and sweep
+    in O(N log N): individuals are visited in lexicographic order of their
+    costs, so only the previously visited ones can dominate them, and each
+    one joins the first front that does not dominate it (binary search).
 
-    # Other fronts
-    i = 0
-    while len(front_groups[i]) > 0:
-        next_front = []
-        for idx1 in front_groups[i]:
-            for idx2 in dominated_lists[idx1]:
-                domination_counters[idx2] += -1
-                if domination_counters[idx2] == 0:
-                    ranks[idx2] = i + 1
-                    next_front.append(idx2)
-        i += 1
-        front_groups.append(next_front)
+    :param costs_array: 2d array of (occupancy cost, accounting cost)
+    :return: indices of the individuals of each front (in increasing
+             order) and the front number of each individual.
+    """
+    n = len(costs_array)
+    ranks = np.zeros(n)
+    # Lexicographic order: stable sort by the second cost, then the first.
+    order = np.argsort(costs_array[:, 1], kind='mergesort')
+    order = order[np.argsort(costs_array[order, 0], kind='mergesort')]
+    # Costs of the last individual added to each front, which has the
+    # lowest second cost of the front.
+    fronts_cost1 = np.empty(n)
+    fronts_cost2 = np.empty(n)
+    n_fronts = 0
+    for idx in order:
+        cost1, cost2 = costs_array[idx, 0], costs_array[idx, 1]
+        # Being dominated by a front implies being dominated by the
+        # previous ones.
+        low, high = 0, n_fronts
+        while low < high:
+            middle = (low + high) // 2
+            if fronts_cost2[middle] < cost2 or \
+                    (fronts_cost2[middle] == cost2 and
+                     fronts_cost1[middle] < cost1):
+                low = middle + 1
+            else:
+                high = middle
+        ranks[idx] = low
+        fronts_cost1[low] = cost1
+        fronts_cost2[low] = cost2
+        if low == n_fronts:
+            n_fronts += 1
 
-    if len(front_groups[-1]) == 0:
-        del front_groups[-1]
+    front_idx = np.argsort(ranks, kind='mergesort')
+    front_sizes = np.bincount(ranks.astype(np.int64), minlength=n_fronts)
+    front_groups = []
+    start = 0
+    for size in front_sizes:
+        front_groups.append(list(front_idx[start:start + size]))
+        start += size
 
     return front_groups, ranks
 
 
 def crowding_distance(costs_array: np.array, front_no: np.array) -> np.array:
     """
-    The crowding distance of each Pareto front
+    The crowding distance of each Pareto front, computed for all the fronts
+    at once: individuals are sorted by front then by cost, so that the
+    members of each front are contiguous.
+    The boundaries of each front and its individual of minimum total cost
+    have an infinite crowding distance.
     :param costs_array: 2d array, with:
            first column: occupancy cost
            second column: accounting cost
@@ -71,20 +82,27 @@ def crowding_distance(costs_array: np.array, front_no: np.array) -> np.array:
     """
     n, M = np.shape(costs_array)
     crowd_dis = np.zeros(n)
-    front = np.unique(front_no)
-    Fronts = front[front != np.inf]
-    for f in range(len(Fronts)):
-        Front = np.array([k for k in range(len(front_no))
-                          if front_no[k] == Fronts[f]])
-        Fmax = costs_array[Front, :].max(0)
-        Fmin = costs_array[Front, :].min(0)
-        min_cost_idx = np.argmin(costs_array[Front, :].sum(axis=1))
-        for i in range(M):
-            rank = np.argsort(costs_array[Front, i])
-            crowd_dis[Front[rank[0]]] = np.inf
-            crowd_dis[Front[rank[-1]]] = np.inf
-            crowd_dis[Front[min_cost_idx]] = np.inf
-            for j in range(1, len(Front) - 1):
-                crowd_dis[Front[rank[j]]] = crowd_dis[Front[rank[j]]] + (costs_array[(Front[rank[j + 1]], i)] - costs_array[
-                    (Front[rank[j]], i)]) / (Fmax[i] - Fmin[i])
+    members = np.nonzero(front_no != np.inf)[0]
+    if len(members) == 0:
+        return crowd_dis
+    boundaries = []
+    for i in range(M):
+        order = members[np.lexsort((costs_array[members, i],
+                                    front_no[members]))]
+        costs = costs_array[order, i]
+        fronts = front_no[order]
+        first = np.append(True, fronts[1:] != fronts[:-1])
+        last = np.append(fronts[1:] != fronts[:-1], True)
+        # Range of the costs of the front of each individual
+        span = (costs[last] - costs[first])[np.cumsum(first) - 1]
+        gaps = np.append(costs[1:] - costs[:-1], 0)
+        interior = ~(first | last) & (span > 0)
+        crowd_dis[order[interior]] += gaps[interior] / span[interior]
+        boundaries.append(order[first | last])
+    # Minimum total cost of each front
+    order = members[np.lexsort((members, costs_array[members].sum(axis=1),
+                                front_no[members]))]
+    fronts = front_no[order]
+    boundaries.append(order[np.append(True, fronts[1:] != fronts[:-1])])
+    crowd_dis[np.concatenate(boundaries)] = np.inf
     return crowd_dis
@@ -2,6 +2,22 @@ import numpy as np
 from .evaluation import fast_non_dominated_sort, crowding_distance
 
 
+def environment_selection_idx(costs_array, n_selected):
+    """Index of the environmental selection (see environment_selection) of
+    n_selected individuals, so that they can be copied into preallocated
+    arrays.
+
+    :return: index of the selected individuals by increasing total cost,
+             and their front number and crowding distance among them.
+    """
+    total_costs = costs_array.sum(axis=1)
+    selection_idx = np.argsort(total_costs)[:n_selected]
+    selected_costs = costs_array[selection_idx, :]
+    _, ranks = fast_non_dominated_sort(selected_costs)
+    crowd_dis = crowding_distance(selected_costs, ranks)
+    return selection_idx, ranks, crowd_dis
+
+
 def environment_selection(population, costs_array, N, selection_rate):
     '''
     environmental selection in NSGA-II, with the specification that
@@ -12,14 +28,9 @@ def environment_selection(population, costs_array, N, selection_rate):
                            occ_cost + acc_cost
     :return: next population
     '''
-    total_costs = costs_array.sum(axis=1)
-    sorted_idx = np.argsort(total_costs)
-    selection_idx = sorted_idx[:int(selection_rate * len(sorted_idx))]
-    costs_array = costs_array[selection_idx, :]
-    population = population[selection_idx]
-    front_groups, ranks = fast_non_dominated_sort(costs_array)
-
-    crowd_dis = crowding_distance(costs_array, ranks)
+    selection_idx, ranks, crowd_dis = environment_selection_idx(
+        costs_array, int(selection_rate * len(costs_array))
+    )
 
-    return (population, ranks,
+    return (population[selection_idx], ranks,
             crowd_dis)
\ No newline at end of file
@@ -0,0 +1,115 @@
+from numba import njit
+import numpy as np
+
+
+@njit(cache=True)
+def repair_occupancy(problem, individual, occupancy):
+    """Moves families of individual until every day is within the occupancy
+    bounds, choosing at each step the move with the lowest occupancy cost
+    increase: families first leave the over-occupied days for days with
+    room, then the under-occupied days are filled from the days that can
+    spare them.
+
+    :param occupancy: occupancy of each day of individual (day d at index
+                      d - 1), updated in place along the moves.
+    :return: the moved families, possibly repeated.
+    """
+    n_days = problem.n_days
+    cost_matrix = problem.cost_matrix
+    family_size = problem.family_size
+    moved_families = np.empty(16, dtype=np.int64)
+    n_moves = 0
+
+    for day in range(n_days):
+        if occupancy[day] <= problem.max_occupancy:
+            continue
+        candidates = np.nonzero(individual == day + 1)[0]
+        while occupancy[day] > problem.max_occupancy:
+            best_increase = np.inf
+            best_family = -1
+            best_day = -1
+            for family_idx in candidates:
+                if individual[family_idx] != day + 1:
+                    continue
+                n = family_size[family_idx]
+                for new_day in range(n_days):
+                    if occupancy[new_day] + n > problem.max_occupancy:
+                        continue
+                    increase = cost_matrix[family_idx, new_day] - \
+                        cost_matrix[family_idx, day]
+                    if increase < best_increase:
+                        best_increase = increase
+                        best_family = family_idx
+                        best_day = new_day
+            if best_family < 0:
+                break
+            occupancy[day] -= family_size[best_family]
+            occupancy[best_day] += family_size[best_family]
+            individual[best_family] = best_day + 1
+            if n_moves == len(moved_families):
+                moved_families = np.concatenate((moved_families,
+                                                 moved_families))
+            moved_families[n_moves] = best_family
+            n_moves += 1
+
+    for day in range(n_days):
+        while occupancy[day] < problem.min_occupancy:
+            best_increase = np.inf
+            best_family = -1
+            for family_idx in range(len(individual)):
+                old_day = individual[family_idx] - 1
+                n = family_size[family_idx]
+                if old_day == day or \
+                        occupancy[old_day] - n < problem.min_occupancy or \
+                        occupancy[day] + n > problem.max_occupancy:
+                    continue
+                increase = cost_matrix[family_idx, day] - \
+                    cost_matrix[family_idx, old_day]
+                if increase < best_increase:
+                    best_increase = increase
+                    best_family = family_idx
+            if best_family < 0:
+                break
+            occupancy[individual[best_family] - 1] -= family_size[best_family]
+            occupancy[day] += family_size[best_family]
+            individual[best_family] = day + 1
+            if n_moves == len(moved_families):
+                moved_families = np.concatenate((moved_families,
+                                                 moved_families))
+            moved_families[n_moves] = best_family
+            n_moves += 1
+
+    return moved_families[:n_moves]
+
+
+@njit(cache=True)
+def repair_offsprings(problem, offsprings, parents, parents_idx, changed,
+                      daily_occupancies):
+    """Repairs in place the offsprings violating the occupancy bounds (see
+    repair_occupancy). The occupancy of each offspring is derived from the
+    cached one of its parent and the families that changed.
+
+    :param offsprings: 2D array of offsprings
+    :param parents: 2D array of parents
+    :param parents_idx: index in parents of the parent of each offspring
+    :param changed: for each offspring, mask of the families whose choice
+                    may differ from its parent, completed in place with the
+                    families moved by the repair.
+    :param daily_occupancies: daily occupancies of parents
+                              (see metrics.computes_daily_states)
+    """
+    n_days = problem.n_days
+    occupancy = np.empty(n_days, dtype=np.int64)
+    for i in range(len(offsprings)):
+        offspring = offsprings[i]
+        parent = parents[parents_idx[i]]
+        occupancy[:] = daily_occupancies[parents_idx[i], :n_days]
+        for family_idx in range(len(offspring)):
+            if changed[i, family_idx]:
+                n = problem.family_size[family_idx]
+                occupancy[parent[family_idx] - 1] -= n
+                occupancy[offspring[family_idx] - 1] += n
+        if (occupancy < problem.min_occupancy).any() or \
+                (occupancy > problem.max_occupancy).any():
+            for family_idx in repair_occupancy(problem, offspring, occupancy):
+                changed[i, family_idx] = True
@@ -1,45 +1,92 @@
-from numba import njit
 import numpy as np
 
-from utils import proportional_random_choice
 
-@njit
-def sort_population(population, scores):
-    sort_idx = np.argsort(scores)
-    return population[sort_idx]
+def selection_fitness(ranks, crowd_dis):
+    """Fitness of the individuals selected by
+    nsgaII.selection.environment_selection: their front number then their
+    opposite crowding distance, so that lower is better for both.
+    """
+    return np.column_stack((ranks, -crowd_dis))
 
 
-def uniform_selection(population, scores, selection_rate):
-    population = sort_population(population, scores)
-    return population[:int(selection_rate * len(population))]
+def lexicographic_positions(fit):
+    """Position of each individual in the lexicographic order of fit
+    (lower is better), equal individuals sharing their position, so that
+    individuals are compared by comparing their positions.
 
+    :param fit: 2D array of the fitness vectors, or 1D array of fitnesses
+    :return: positions, from 0 (best) to the number of distinct fitness
+             vectors minus one.
+    """
+    fit = np.asarray(fit).reshape((len(fit), -1))
+    positions = np.zeros(len(fit), dtype=np.int64)
+    if len(fit) == 0:
+        return positions
+    # np.lexsort sorts by its last key first
+    order = np.lexsort(fit.T[::-1])
+    sorted_fit = fit[order]
+    new_level = (sorted_fit[1:] != sorted_fit[:-1]).any(axis=1)
+    positions[order[1:]] = np.cumsum(new_level)
+    return positions
 
-def stochastic_selection(population, scores, selection_rate):
-    N = int(selection_rate * len(population))
-    selection_idx = proportional_random_choice(scores, N)
-    return population[selection_idx]
 
+def tournament(fit, n_selected, n_opponents=1):
+    """Tournament selection: each of the n_selected winners is the best of
+    a random individual and n_opponents random opponents. The matchups of
+    all the tournaments are drawn at once.
 
-@njit
-def tournament(N, n_opponents, fit):
-    '''
-    Binary tournament selection
-    :param N: number of solutions to be selected
-    :param fit: fitness vectors.
-                1st column: front_no,
-                2nd column: crowding distance
-    :return: index of selected solutions
-    '''
-    n = len(fit)
-    winners = []
-    for i in range(N):
-        a = np.random.randint(n)
-        for j in range(n_opponents):
-            b = np.random.randint(n)
-            for r in range(fit[0, :].size):
-                if fit[(b, r)] < fit[(a, r)]:
-                    a = b
-        winners.append(a)
+    :return: index of the winners
+    """
+    positions = lexicographic_positions(fit)
+    matchups = np.random.randint(len(positions),
+                                 size=(n_selected, n_opponents + 1))
+    best = np.argmin(positions[matchups], axis=1)
+    return matchups[np.arange(n_selected), best]
 
-    return winners
 
+def truncation(fit, n_selected):
+    """The n_selected best individuals, the selection being repeated from
+    the best one if n_selected exceeds the population.
+
+    :return: index of the selected individuals, from the best
+    """
+    order = np.argsort(lexicographic_positions(fit), kind='stable')
+    return np.resize(order, n_selected)
+
+
+def stochastic_universal_sampling(fit, n_selected):
+    """Stochastic universal sampling with linear ranking: an individual is
+    selected in proportion of the number of distinct fitness vectors
+    worse than or equal to its own, by n_selected evenly spaced pointers
+    from a single random offset.
+
+    :return: index of the selected individuals
+    """
+    positions = lexicographic_positions(fit)
+    cumulative_weights = np.cumsum(positions.max() + 1 - positions)
+    step = cumulative_weights[-1] / n_selected
+    pointers = (np.random.random() + np.arange(n_selected)) * step
+    return np.searchsorted(cumulative_weights, pointers, side='right')
+
+
+SELECTIONS = {
+    'tournament': tournament,
+    'truncation': truncation,
+    'sus': stochastic_universal_sampling
+}
+
+
+def select(fit, n_selected, strategy='tournament', **options):
+    """Selects n_selected individuals on their fitness vectors, compared
+    lexicographically (lower is better), e.g. the (rank, -crowding
+    distance) of NSGA-II (see selection_fitness).
+
+    :param fit: 2D array of the fitness vectors, or 1D array of fitnesses
+    :param strategy: one of SELECTIONS
+    :param options: options of the strategy, e.g. n_opponents for
+                    tournament
+    :return: index of the selected individuals
+    """
+    if strategy not in SELECTIONS:
+        raise ValueError(f'Unknown selection strategy: {strategy}')
+    return SELECTIONS[strategy](fit, n_selected, **options)
@@ -1,60 +1,58 @@
-from numba import njit, jit
-from tqdm import tqdm
+from numba import njit, jit, prange
 import numpy as np
 
-from load_data_and_constants import (family_size,
-                                     MIN_OCCUPANCY,
-                                     MAX_OCCUPANCY,
-                                     days_array, data)
+from genetic_algoritms.repairs import repair_occupancy
 
-data_array = data.loc[:, 'choice_0': 'choice_9'].to_numpy()
-days_list = days_array.tolist()
+# Convex piecewise linear surrogate of the accounting costs used by
+# solve_relaxation: for each segment of the change of occupancy between two
+# consecutive days, its width in people (None if unbounded) and its cost
+# per person.
+CHANGE_COSTS = ((10, 0.5), (20, 5.), (None, 50.))
 
 
-@njit
-def generate_random_individual():
+@njit(cache=True)
+def generate_random_individual(problem):
     """Complete randomness"""
+    n_days = problem.n_days
+    daily_occupancy = np.zeros(n_days + 1)
+    prediction = np.zeros(len(problem.family_size),
+                          dtype=problem.data_array.dtype)
+    while (daily_occupancy[1:] < problem.min_occupancy).any():
+        daily_occupancy = np.zeros(n_days + 1)
+        for i, n in enumerate(problem.family_size):
+            random_day = np.random.randint(1, n_days + 1)
+            while daily_occupancy[random_day] + n > problem.max_occupancy:
+                random_day = np.random.randint(1, n_days + 1)
 
-    daily_occupancy = np.zeros((len(days_array)+1))
-    while (daily_occupancy[1:] < MIN_OCCUPANCY).any():
-        daily_occupancy = np.zeros((len(days_array)+1))
-        prediction = np.zeros(len(family_size))
-
-        for i, n in enumerate(family_size):
-            anticipated_occupation = 301
-            while anticipated_occupation > MAX_OCCUPANCY:
-                random_day = np.random.choice(days_array)
-                anticipated_occupation = daily_occupancy[random_day] + n
-
-            daily_occupancy[random_day] = anticipated_occupation
+            daily_occupancy[random_day] += n
             prediction[i] = random_day
 
     return prediction
 
 
 @jit
-def generate_naive_random_optimum():
+def generate_naive_random_optimum(problem):
     """Generate a random individual, with consideration of
     family choices.
     """
-    daily_occupancy = np.zeros((len(days_array)+1))
-    prediction = np.zeros(len(family_size))
-    available_days = list(days_array)
-    for i, n in enumerate(family_size):
-        prefered_days = data_array[i, :].tolist()
+    daily_occupancy = np.zeros(problem.n_days + 1)
+    prediction = np.zeros(len(problem.family_size),
+                          dtype=problem.data_array.dtype)
+    available_days = list(range(problem.n_days, 0, -1))
+    for i, n in enumerate(problem.family_size):
+        prefered_days = problem.data_array[i, :].tolist()
         prefered_days = [d for d in prefered_days if d in available_days]
-        anticipated_occupation = 301
-        while anticipated_occupation > MAX_OCCUPANCY:
+        while True:
             if len(prefered_days) == 0:
                 choice = np.random.choice(available_days)
             else:
                 choice = np.random.choice(prefered_days)
 
-            anticipated_occupation = daily_occupancy[choice] + n
-            if anticipated_occupation > MAX_OCCUPANCY:
-                available_days.remove(choice)
-                if len(prefered_days) > 0:
-                    prefered_days.remove(choice)
+            if daily_occupancy[choice] + n <= problem.max_occupancy:
+                break
+            available_days.remove(choice)
+            if len(prefered_days) > 0:
+                prefered_days.remove(choice)
 
         prediction[i] = choice
         daily_occupancy[choice] += n
@@ -62,11 +60,257 @@ def generate_naive_random_optimum():
     return prediction
 
 
-def initialise_population(n_individuals):
-    population = []
-    for i in tqdm(range(n_individuals),
-                  desc=f'Generating {n_individuals} individuals:'):
-        population.append(
-            generate_random_individual().astype(int)
-        )
-    return np.array(population)
\ No newline at end of file
+@njit(cache=True)
+def repair_assignment(problem, solution):
+    """Restores the occupancy bounds of solution with the cheapest moves
+    (see genetic_algoritms.repairs.repair_occupancy).
+
+    :return: solution, repaired in place, and whether it is feasible.
+    """
+    occupancy = np.zeros(problem.n_days, dtype=np.int64)
+    for family_idx in range(len(solution)):
+        occupancy[solution[family_idx] - 1] += problem.family_size[family_idx]
+    repair_occupancy(problem, solution, occupancy)
+    feasible = ((occupancy >= problem.min_occupancy) &
+                (occupancy <= problem.max_occupancy)).all()
+    return solution, feasible
+
+
+def solve_relaxation(problem, noise=0., time_limit=None,
+                     change_costs=CHANGE_COSTS):
+    """Solves the linear relaxation of the assignment of each family to one
+    of its choices minimizing the occupancy costs, with the occupancy
+    bounds of each day as constraints (HiGHS through scipy). Accounting
+    costs are replaced by the convex surrogate change_costs. Occupancies
+    out of the bounds are allowed at a cost per person above the one of any
+    choice, so that the relaxation is always feasible.
+
+    :param noise: amplitude of a uniform noise added to the occupancy costs,
+                  to break ties differently from one call to the next.
+    :param time_limit: in seconds, none if None.
+    :param change_costs: see CHANGE_COSTS.
+    :return: (n_families, n_choices) array of the fraction of each family
+             assigned to each of its choices.
+    """
+    from scipy import optimize, sparse
+
+    n_families, n_choices = problem.data_array.shape
+    n_days = problem.n_days
+    n_variables = n_families * n_choices
+    n_changes = n_days - 1
+    families = np.repeat(np.arange(n_families), n_choices)
+    days = np.asarray(problem.data_array).ravel() - 1
+    costs = problem.cost_matrix[families, days].astype(np.float64)
+    if noise > 0:
+        costs += noise * np.random.random(n_variables)
+
+    # Variables: assignments, slacks below the minimum and above the maximum
+    # occupancy of each day, then the changes of occupancy between
+    # consecutive days split in the segments of change_costs.
+    occupancy = sparse.csr_matrix(
+        (problem.family_size[families].astype(np.float64),
+         (days, np.arange(n_variables))),
+        shape=(n_days, n_variables)
+    )
+    change = occupancy[:-1] - occupancy[1:]
+    slack = sparse.identity(n_days, format='csr')
+    no_slack = sparse.csr_matrix((n_days, n_days))
+    segments = sparse.hstack([sparse.identity(n_changes, format='csr')] *
+                             len(change_costs))
+    no_segments = sparse.csr_matrix((n_days, n_changes * len(change_costs)))
+    no_slacks = sparse.csr_matrix((n_changes, 2 * n_days))
+    a_ub = sparse.vstack([
+        sparse.hstack([-occupancy, -slack, no_slack, no_segments]),
+        sparse.hstack([occupancy, no_slack, -slack, no_segments]),
+        sparse.hstack([change, no_slacks, -segments]),
+        sparse.hstack([-change, no_slacks, -segments])
+    ])
+    b_ub = np.concatenate([np.full(n_days, -problem.min_occupancy),
+                           np.full(n_days, problem.max_occupancy),
+                           np.zeros(2 * n_changes)])
+    # Each family is fully assigned.
+    a_eq = sparse.hstack([
+        sparse.csr_matrix((np.ones(n_variables),
+                           (families, np.arange(n_variables))),
+                          shape=(n_families, n_variables)),
+        sparse.csr_matrix((n_families, a_ub.shape[1] - n_variables))
+    ])
+    b_eq = np.ones(n_families)
+
+    slack_cost = float(problem.penalties[:, -1].max())
+    c = np.concatenate(
+        [costs, np.full(2 * n_days, slack_cost)] +
+        [np.full(n_changes, cost) for _, cost in change_costs]
+    )
+    bounds = np.zeros((len(c), 2))
+    bounds[:n_variables, 1] = 1
+    bounds[n_variables:, 1] = np.inf
+    for k, (width, _) in enumerate(change_costs):
+        if width is not None:
+            start = n_variables + 2 * n_days + k * n_changes
+            bounds[start:start + n_changes, 1] = width
+
+    options = {} if time_limit is None else {'time_limit': time_limit}
+    result = optimize.linprog(c, a_ub.tocsr(), b_ub, a_eq.tocsr(), b_eq,
+                              bounds, method='highs', options=options)
+    if result.x is None:
+        raise RuntimeError(f'Relaxation not solved: {result.message}')
+    return result.x[:n_variables].reshape((n_families, n_choices))
+
+
+def generate_relaxed_individual(problem, noise=0., time_limit=None):
+    """Individual from the linear relaxation of the assignment (see
+    solve_relaxation): each family gets its choice of largest fraction,
+    then the occupancy bounds are restored (see repair_assignment).
+    """
+    fractions = solve_relaxation(problem, noise, time_limit)
+    solution = problem.data_array[np.arange(len(fractions)),
+                                  np.argmax(fractions, axis=1)]
+    solution, _ = repair_assignment(problem, solution)
+    return solution
+
+
+@njit(cache=True)
+def families_by_day(problem):
+    """Families having each day among their choices: the families of day d
+    are families[starts[d - 1]:starts[d]].
+
+    :return: families and starts arrays.
+    """
+    data_array = problem.data_array
+    n_families, n_choices = data_array.shape
+    starts = np.zeros(problem.n_days + 1, dtype=np.int64)
+    for family_idx in range(n_families):
+        for idx in range(n_choices):
+            starts[data_array[family_idx, idx]] += 1
+    starts = np.cumsum(starts)
+    positions = starts[:-1].copy()
+    families = np.empty(starts[-1], dtype=np.int64)
+    for family_idx in range(n_families):
+        for idx in range(n_choices):
+            day = data_array[family_idx, idx] - 1
+            families[positions[day]] = family_idx
+            positions[day] += 1
+    return families, starts
+
+
+@njit(cache=True)
+def construct_individual(problem, families, starts, individual):
+    """Builds a random feasible individual in place, without restarts:
+    days are first filled up to the minimum occupancy with families that
+    chose them (then with any family), and the other families get a random
+    choice with room left, or the next day with room after a random one.
+    Should the instance leave no room for that, the individual is repaired
+    (see repair_assignment).
+
+    :param families, starts: see families_by_day.
+    """
+    n_days = problem.n_days
+    data_array = problem.data_array
+    family_size = problem.family_size
+    n_families, n_choices = data_array.shape
+    individual[:] = 0
+    occupancy = np.zeros(n_days, dtype=np.int64)
+
+    # Days under the minimum occupancy, from the families that chose them
+    for day in np.random.permutation(n_days):
+        start = starts[day]
+        n_candidates = starts[day + 1] - start
+        if n_candidates == 0:
+            continue
+        offset = np.random.randint(n_candidates)
+        for k in range(n_candidates):
+            if occupancy[day] >= problem.min_occupancy:
+                break
+            family_idx = families[start + (offset + k) % n_candidates]
+            n = family_size[family_idx]
+            if individual[family_idx] == 0 and \
+                    occupancy[day] + n <= problem.max_occupancy:
+                individual[family_idx] = day + 1
+                occupancy[day] += n
+
+    # then from any family
+    order = np.random.permutation(n_families)
+    k = 0
+    for day in range(n_days):
+        while occupancy[day] < problem.min_occupancy and k < n_families:
+            family_idx = order[k]
+            k += 1
+            n = family_size[family_idx]
+            if individual[family_idx] == 0 and \
+                    occupancy[day] + n <= problem.max_occupancy:
+                individual[family_idx] = day + 1
+                occupancy[day] += n
+
+    # Other families
+    for family_idx in order:
+        if individual[family_idx] != 0:
+            continue
+        n = family_size[family_idx]
+        new_day = -1
+        offset = np.random.randint(n_choices)
+        for k in range(n_choices):
+            day = data_array[family_idx, (offset + k) % n_choices] - 1
+            if occupancy[day] + n <= problem.max_occupancy:
+                new_day = day
+                break
+        if new_day < 0:
+            offset = np.random.randint(n_days)
+            for k in range(n_days):
+                day = (offset + k) % n_days
+                if occupancy[day] + n <= problem.max_occupancy:
+                    new_day = day
+                    break
+        if new_day < 0:
+            new_day = np.argmin(occupancy)
+        individual[family_idx] = new_day + 1
+        occupancy[new_day] += n
+
+    if (occupancy < problem.min_occupancy).any() or \
+            (occupancy > problem.max_occupancy).any():
+        repair_assignment(problem, individual)
+    return individual
+
+
+@njit(cache=True)
+def draw_seeds(n_seeds):
+    """Seeds drawn from the random state of the calling thread, outside of
+    any parallel region (in a parallel function, array draws may be split
+    between threads).
+    """
+    return np.random.randint(0, 2 ** 31 - 1, n_seeds)
+
+
+@njit(parallel=True, cache=True)
+def generate_population(problem, n_individuals):
+    """Random feasible population built in one multi-threaded call (see
+    construct_individual).
+
+    Each thread has its own random state, which seed_compiled_functions
+    does not seed: every individual is built from its own seed, drawn
+    beforehand, so that the population only depends on the seed of the
+    calling thread. That state is then reseeded as well, since the calling
+    thread takes part in the loop.
+    """
+    families, starts = families_by_day(problem)
+    population = np.zeros((n_individuals, len(problem.family_size)),
+                          dtype=problem.data_array.dtype)
+    seeds = draw_seeds(n_individuals + 1)
+    for i in prange(n_individuals):
+        np.random.seed(seeds[i])
+        construct_individual(problem, families, starts, population[i])
+    np.random.seed(seeds[n_individuals])
+    return population
+
+
+def initialise_population(problem, n_individuals, seeds=None):
+    """
+    :param seeds: individuals put first in the population (e.g. from
+                  generate_relaxed_individual), the others are random
+                  (see generate_population).
+    """
+    population = generate_population(problem, n_individuals)
+    if seeds is not None:
+        seeds = np.asarray(seeds)[:n_individuals]
+        population[:len(seeds)] = seeds
+    return population
@@ -1,49 +1,331 @@
-import pandas as pd
+from collections import namedtuple
+from functools import lru_cache
+import hashlib
+from multiprocessing import shared_memory
+import os
+import shutil
+import tempfile
+
 import numpy as np
 
 
-data = pd.read_csv('data/family_data.csv', index_col='family_id')
-data_array = data.loc[:, 'choice_0': 'choice_9'].to_numpy()
-submission = pd.read_csv('data/sample_submission.csv', index_col='family_id')
+DATA_PATH = 'data/family_data.csv'
+# Precomputed problem arrays, stored in a sub-directory named after the hash
+# of the family data so that the cache is rebuilt whenever the csv changes.
+CACHE_DIR = 'data/cache'
+CACHED_ARRAYS = ('data_array', 'family_size', 'penalties', 'cost_matrix')
 
 
-# Constants
+# Dimensions of the competition instance, defaults of the problem parameters
 N_DAYS = 100
+N_CHOICES = 10
 MAX_OCCUPANCY = 300
 MIN_OCCUPANCY = 125
+# Occupancy subtracted in the accounting formula of the competition,
+# (N_d - 125) / 400 * N_d ** (0.5 + |N_d - N_d+1| / 50), kept by default on
+# every instance whatever its occupancy bounds.
+ACCOUNTING_OFFSET = 125
+# Number of people of the 5000 families of the competition data
+# (family_data.csv), over N_DAYS days.
+COMPETITION_N_PEOPLE = 21675
+
+
+def compute_penalties(max_family_size, n_choices=N_CHOICES):
+    """Occupancy cost of each family size (rows) for each of its n_choices
+    choices, followed by the cost of any other day (last column).
+    """
+    if n_choices > N_CHOICES:
+        raise ValueError(f'At most {N_CHOICES} choices per family are '
+                         f'supported, got {n_choices}')
+    penalties = np.asarray([
+        [
+            0,
+            50,
+            50 + 9 * n,
+            100 + 9 * n,
+            200 + 9 * n,
+            200 + 18 * n,
+            300 + 18 * n,
+            300 + 36 * n,
+            400 + 36 * n,
+            500 + 36 * n + 199 * n,
+            500 + 36 * n + 398 * n
+        ] for n in range(max_family_size + 1)
+    ])
+    return np.hstack([penalties[:, :n_choices], penalties[:, -1:]])
 
-family_size = data.n_people.values
-days_array = np.arange(N_DAYS, 0, -1)
-choice_dict = data.loc[:, 'choice_0': 'choice_9'].T.to_dict()
-
-penalties = np.asarray([
-    [
-        0,
-        50,
-        50 + 9 * n,
-        100 + 9 * n,
-        200 + 9 * n,
-        200 + 18 * n,
-        300 + 18 * n,
-        300 + 36 * n,
-        400 + 36 * n,
-        500 + 36 * n + 199 * n,
-        500 + 36 * n + 398 * n
-    ] for n in range(family_size.max() + 1)
-])
-
-
-def compute_cost_matrix():
-    cost_matrix = np.concatenate(data.n_people.apply(
-        lambda n: np.repeat(penalties[n, 10], 100).reshape(1, 100)))
-    for fam in data.index:
-        for choice_order, day in enumerate(data.loc[fam].drop("n_people")):
-            cost_matrix[fam, day -
-                        1] = penalties[data.loc[fam, "n_people"], choice_order]
+
+def compute_cost_matrix(data_array, family_size, penalties, n_days=N_DAYS):
+    """Occupancy cost of assigning each family to each day."""
+    family_penalties = penalties[family_size]
+    cost_matrix = np.repeat(family_penalties[:, -1:], n_days, axis=1)
+    families = np.arange(len(family_size)).reshape((-1, 1))
+    cost_matrix[families, data_array - 1] = family_penalties[:, :-1]
     return cost_matrix
 
 
-cost_matrix = compute_cost_matrix()
-av_penalties = penalties[int(np.mean(family_size))]
-weights = 2 - av_penalties / av_penalties.max()
-max_similarity_distance = 20 * weights.sum()
+def compute_accounting_costs(min_occupancy=MIN_OCCUPANCY,
+                             max_occupancy=MAX_OCCUPANCY,
+                             accounting_offset=ACCOUNTING_OFFSET):
+    """Accounting cost of a day for every feasible occupancy (rows) and
+    occupancy of the next day (columns).
+    """
+    n = np.arange(min_occupancy, max_occupancy + 1).reshape((-1, 1))
+    diff = np.abs(n - n.reshape((1, -1)))
+    return np.maximum(0, (n - float(accounting_offset)) / 400.0 *
+                      n ** (0.5 + diff / 50.0))
+
+
+def file_hash(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+
+def build_problem_arrays(path=DATA_PATH):
+    import pandas as pd
+
+    data = pd.read_csv(path, index_col='family_id')
+    data_array = data.filter(regex=r'^choice_\d+$').to_numpy()
+    family_size = data.n_people.to_numpy()
+    return problem_arrays(data_array, family_size)
+
+
+def generate_family_data(n_families=5000, n_days=N_DAYS, n_choices=N_CHOICES,
+                         seed=0):
+    """Seeded synthetic family data, distributed like the competition data:
+    families of 2 to 8 people choosing n_choices distinct days, with a
+    preference for the days close to Christmas (day 1).
+
+    :return: choices (n_families, n_choices) and family sizes.
+    """
+    rng = np.random.default_rng(seed)
+    family_size = rng.choice(np.arange(2, 9), size=n_families,
+                             p=[.15, .2, .25, .15, .12, .08, .05])
+    day_weights = 1 + 2 * np.exp(-np.arange(n_days) / 10)
+    day_weights /= day_weights.sum()
+    # Gumbel top-k: n_choices distinct days per family drawn with
+    # probabilities day_weights, for all families at once.
+    keys = np.log(day_weights) + rng.gumbel(size=(n_families, n_days))
+    data_array = 1 + np.argsort(-keys, axis=1)[:, :n_choices]
+    return data_array, family_size
+
+
+def synthetic_occupancy_bounds(n_people, n_days):
+    """Occupancy bounds scaled from the competition ones by the mean daily
+    occupancy of an instance of n_people over n_days.
+    """
+    scale = n_people / n_days / (COMPETITION_N_PEOPLE / N_DAYS)
+    return (max(1, int(MIN_OCCUPANCY * scale)),
+            max(2, int(np.ceil(MAX_OCCUPANCY * scale))))
+
+
+def day_dtype(n_days):
+    """Smallest unsigned integer type of the days 1 to n_days, that of the
+    solutions and choices (uint8 up to 255 days).
+    """
+    return np.min_scalar_type(n_days)
+
+
+def occupancy_dtype(n_people):
+    """Smallest signed integer type, at least int16, of the occupancy of a
+    day, which cannot exceed the n_people of the instance.
+    """
+    return np.promote_types(np.int16, np.min_scalar_type(-int(n_people)))
+
+
+def cost_dtype(costs):
+    """float32 if it represents costs exactly, float64 otherwise."""
+    return np.float32 if np.array_equal(costs.astype(np.float32), costs) \
+        else np.float64
+
+
+def compact_arrays(arrays, n_days):
+    """Arrays of problem_arrays in their compact types: choices in the day
+    type, family sizes in the occupancy type, which the kernels use for the
+    solutions and occupancies they allocate, and the cost matrix in float32
+    when exact. Arrays already compact are not copied.
+    """
+    family_size = arrays['family_size']
+    return dict(
+        arrays,
+        data_array=arrays['data_array'].astype(day_dtype(n_days),
+                                               copy=False),
+        family_size=family_size.astype(occupancy_dtype(family_size.sum()),
+                                       copy=False),
+        cost_matrix=arrays['cost_matrix'].astype(
+            cost_dtype(arrays['cost_matrix']), copy=False
+        )
+    )
+
+
+def problem_arrays(data_array, family_size, n_days=N_DAYS):
+    penalties = compute_penalties(family_size.max(), data_array.shape[1])
+    cost_matrix = compute_cost_matrix(data_array, family_size, penalties,
+                                      n_days)
+    return compact_arrays({
+        'data_array': data_array,
+        'family_size': family_size,
+        'penalties': penalties,
+        'cost_matrix': cost_matrix
+    }, n_days)
+
+
+def save_problem_arrays(arrays, cache_path):
+    """Writes the arrays in a temporary directory renamed at the end, so that
+    concurrent processes never read a partially written cache.
+    """
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = tempfile.mkdtemp(dir=os.path.dirname(cache_path))
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_path, name + '.npy'), array)
+    try:
+        os.rename(tmp_path, cache_path)
+    except OSError:
+        # Already written by another process
+        shutil.rmtree(tmp_path)
+
+
+def load_problem_arrays(path=DATA_PATH, cache_dir=CACHE_DIR):
+    """Memory-maps the precomputed problem arrays, building the cache
+    first if the family data has changed.
+    """
+    cache_path = os.path.join(cache_dir, file_hash(path))
+    if not os.path.isdir(cache_path):
+        save_problem_arrays(build_problem_arrays(path), cache_path)
+    return {
+        name: np.asarray(np.load(os.path.join(cache_path, name + '.npy'),
+                                 mmap_mode='r'))
+        for name in CACHED_ARRAYS
+    }
+
+
+class Problem(namedtuple('Problem', ('data_array', 'family_size',
+                                      'penalties', 'cost_matrix',
+                                      'accounting_costs', 'weights',
+                                      'max_similarity_distance', 'n_days',
+                                      'min_occupancy', 'max_occupancy',
+                                      'accounting_offset'))):
+    """Arrays and dimensions of a problem instance, passed explicitly to the
+    cost kernels and solvers. Being a namedtuple of arrays and scalars, it
+    can be given as is to numba compiled functions.
+
+    Days are numbered from 1 to n_days, families choose among
+    data_array.shape[1] days and the occupancy of a feasible day is between
+    min_occupancy and max_occupancy. The accounting cost of a day of
+    occupancy n is computed from n - accounting_offset.
+
+    Solutions are arrays of data_array.dtype and daily occupancies of
+    family_size.dtype (see compact_arrays).
+    """
+
+
+def make_problem(arrays, min_occupancy=MIN_OCCUPANCY,
+                 max_occupancy=MAX_OCCUPANCY,
+                 accounting_offset=ACCOUNTING_OFFSET):
+    """Problem from the arrays of problem_arrays."""
+    arrays = compact_arrays(arrays, arrays['cost_matrix'].shape[1])
+    av_penalties = arrays['penalties'][int(np.mean(arrays['family_size']))]
+    weights = 2 - av_penalties / av_penalties.max()
+    return Problem(
+        data_array=arrays['data_array'],
+        family_size=arrays['family_size'],
+        penalties=arrays['penalties'],
+        cost_matrix=arrays['cost_matrix'],
+        accounting_costs=compute_accounting_costs(min_occupancy,
+                                                  max_occupancy,
+                                                  accounting_offset),
+        weights=weights,
+        max_similarity_distance=20 * weights.sum(),
+        n_days=arrays['cost_matrix'].shape[1],
+        min_occupancy=min_occupancy,
+        max_occupancy=max_occupancy,
+        accounting_offset=accounting_offset
+    )
+
+
+def load_problem(path=DATA_PATH, cache_dir=CACHE_DIR):
+    return make_problem(load_problem_arrays(path, cache_dir))
+
+
+def synthetic_problem(n_families=5000, n_days=N_DAYS, n_choices=N_CHOICES,
+                      min_occupancy=None, max_occupancy=None,
+                      accounting_offset=ACCOUNTING_OFFSET, seed=0):
+    """Problem of seeded synthetic family data (see generate_family_data),
+    which does not need data/family_data.csv, e.g. 50000 families over 365
+    days. Occupancy bounds left to None are scaled from the competition
+    ones (see synthetic_occupancy_bounds), while the accounting formula is
+    the competition one unless accounting_offset is given.
+    """
+    data_array, family_size = generate_family_data(n_families, n_days,
+                                                   n_choices, seed)
+    default_min, default_max = synthetic_occupancy_bounds(family_size.sum(),
+                                                          n_days)
+    return make_problem(
+        problem_arrays(data_array, family_size, n_days),
+        default_min if min_occupancy is None else min_occupancy,
+        default_max if max_occupancy is None else max_occupancy,
+        accounting_offset
+    )
+
+
+def share_problem(problem):
+    """Copies the arrays of problem in shared memory, so that worker
+    processes can read them without receiving a pickled copy.
+
+    :return: the shared memory blocks, to be closed and unlinked by the
+             caller once the workers are done, and the descriptors to give
+             to attach_problem.
+    """
+    blocks = []
+    descriptors = {}
+    for name, value in problem._asdict().items():
+        if not isinstance(value, np.ndarray):
+            descriptors[name] = value
+            continue
+        if not (value.flags.c_contiguous or value.flags.f_contiguous):
+            value = np.ascontiguousarray(value)
+        block = shared_memory.SharedMemory(create=True,
+                                           size=max(value.nbytes, 1))
+        np.ndarray(value.shape, value.dtype, buffer=block.buf,
+                   strides=value.strides)[...] = value
+        blocks.append(block)
+        # Layout and writeability are kept so that the compiled kernels
+        # see the same problem type in every process.
+        descriptors[name] = (block.name, value.shape, value.dtype.str,
+                             value.strides, value.flags.writeable)
+    return blocks, descriptors
+
+
+def attach_problem(descriptors):
+    """Problem whose arrays are views of the shared memory blocks created
+    by share_problem.
+
+    :return: the problem and the attached blocks, which must stay open
+             while the problem is used.
+    """
+    blocks = []
+    fields = {}
+    for name, descriptor in descriptors.items():
+        if not isinstance(descriptor, tuple):
+            fields[name] = descriptor
+            continue
+        block_name, shape, dtype, strides, writeable = descriptor
+        block = shared_memory.SharedMemory(name=block_name)
+        array = np.ndarray(shape, dtype, buffer=block.buf, strides=strides)
+        array.flags.writeable = writeable
+        blocks.append(block)
+        fields[name] = array
+    return Problem(**fields), blocks
+
+
+def as_solution(problem, solution):
+    """Copy of solution in the compact type of the solutions of problem,
+    e.g. of a solution read from a file or given by the user.
+    """
+    return np.array(solution, dtype=problem.data_array.dtype, order='C')
+
+
+@lru_cache(maxsize=None)
+def get_problem(path=DATA_PATH):
+    """Problem instance of path, loaded on first use."""
+    return load_problem(path)
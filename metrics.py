@@ -1,45 +1,58 @@
-from numba import njit
+from numba import njit, prange
 import numpy as np
 
-from load_data_and_constants import (N_DAYS, MAX_OCCUPANCY,
-                                     MIN_OCCUPANCY, cost_matrix,
-                                     family_size, penalties,
-                                     weights, max_similarity_distance)
 
+@njit(fastmath=True, cache=True)
+def day_accounting_cost(accounting_costs: np.array, min_occupancy: int,
+                        accounting_offset: int, n: int,
+                        n_next: int) -> float:
+    """Accounting cost of a day, read from the precomputed table
+    (see load_data_and_constants.compute_accounting_costs) when both
+    occupancies are feasible.
+    """
+    max_occupancy = min_occupancy + len(accounting_costs) - 1
+    if n >= min_occupancy and n <= max_occupancy and \
+            n_next >= min_occupancy and n_next <= max_occupancy:
+        return accounting_costs[n - min_occupancy, n_next - min_occupancy]
+    diff = abs(n - n_next)
+    return max(0, (n - accounting_offset) / 400.0 * n**(0.5 + diff / 50.0))
 
-@njit(fastmath=True)
+
+@njit(fastmath=True, cache=True)
 def cost_function(
-    individual: np.array
+    problem, individual: np.array
 ) -> tuple([float, int, int]):
 
     cost = 0
-    daily_occupancy = np.zeros(N_DAYS + 1, dtype=np.int64)
-    for i, (pred, n) in enumerate(zip(individual, family_size)):
+    daily_occupancy = np.zeros(problem.n_days + 1, dtype=np.int64)
+    for i, (pred, n) in enumerate(zip(individual, problem.family_size)):
         daily_occupancy[pred - 1] += n
-        cost += cost_matrix[i, pred - 1]
+        cost += problem.cost_matrix[i, pred - 1]
 
     accounting_cost = 0
     violation_score = 0
     n_violations = 0
     daily_occupancy[-1] = daily_occupancy[-2]
-    for day in range(N_DAYS):
+    for day in range(problem.n_days):
         n_next = daily_occupancy[day + 1]
         n = daily_occupancy[day]
-        violation_score += max(0, n - MAX_OCCUPANCY)
-        violation_score += max(0, MIN_OCCUPANCY - n)
-        n_violations += (n > MAX_OCCUPANCY)
-        n_violations += (n < MIN_OCCUPANCY)
-        diff = abs(n - n_next)
-        accounting_cost += max(0, (n-125.0) / 400.0 * n**(0.5 + diff / 50.0))
+        violation_score += max(0, n - problem.max_occupancy)
+        violation_score += max(0, problem.min_occupancy - n)
+        n_violations += (n > problem.max_occupancy)
+        n_violations += (n < problem.min_occupancy)
+        accounting_cost += day_accounting_cost(problem.accounting_costs,
+                                               problem.min_occupancy,
+                                               problem.accounting_offset,
+                                               n, n_next)
 
     cost += accounting_cost
 
     return cost, n_violations, violation_score
 
 
-@njit
+@njit(cache=True)
 def apply_cost_function(
-    population: np.array
+    problem, population: np.array
 ) -> tuple([np.array, np.array, np.array]):
 
     scores = np.zeros(len(population))
@@ -47,7 +60,7 @@ def apply_cost_function(
     violation_scores = np.zeros(len(population))
 
     for i in range(len(population)):
-        score, n_viol, viol_score = cost_function(population[i])
+        score, n_viol, viol_score = cost_function(problem, population[i])
         scores[i] = score
         n_violations[i] = n_viol
         violation_scores[i] = viol_score
@@ -55,101 +68,451 @@ def apply_cost_function(
     return scores, n_violations, violation_scores
 
 
-@njit(fastmath=True)
-def occupancy_cost(individual: np.array) -> int:
-    daiy_cost = np.zeros(N_DAYS)
-    daily_occupancy = np.zeros(N_DAYS + 1, dtype=np.int64)
-    for i, (pred, n) in enumerate(zip(individual, family_size)):
+@njit(fastmath=True, cache=True)
+def occupancy_cost(problem, individual: np.array) -> int:
+    daiy_cost = np.zeros(problem.n_days)
+    daily_occupancy = np.zeros(problem.n_days + 1, dtype=np.int64)
+    for i, (pred, n) in enumerate(zip(individual, problem.family_size)):
         daily_occupancy[pred - 1] += n
-        daiy_cost[pred - 1] += cost_matrix[i, pred - 1]
+        daiy_cost[pred - 1] += problem.cost_matrix[i, pred - 1]
     return daiy_cost, daily_occupancy
 
 
-@njit(fastmath=True)
-def accounting_cost(individual: np.array,
+@njit(fastmath=True, cache=True)
+def accounting_cost(problem, individual: np.array,
                     daily_occupancy: np.array) -> int:
-    daiy_cost = np.zeros(N_DAYS)
+    daiy_cost = np.zeros(problem.n_days)
     daily_occupancy[-1] = daily_occupancy[-2]
-    for day in range(N_DAYS):
+    for day in range(problem.n_days):
         n_next = daily_occupancy[day + 1]
         n = daily_occupancy[day]
-        diff = abs(n - n_next)
-        cost = max(0, (n-125.0) / 400.0 * n**(0.5 + diff / 50.0))
-        daiy_cost[day] = cost
+        daiy_cost[day] = day_accounting_cost(problem.accounting_costs,
+                                             problem.min_occupancy,
+                                             problem.accounting_offset,
+                                             n, n_next)
     return daiy_cost
 
 
-@njit
-def computes_occ_acc_costs(population):
-    occ_costs = np.zeros((len(population), N_DAYS))
-    acc_costs = np.zeros((len(population), N_DAYS))
+@njit(cache=True)
+def computes_daily_states(problem, population):
+    """Per-day state of each individual (see compute_daily_costs)."""
+    daily_occupancies = np.zeros((len(population), problem.n_days + 1),
+                                 dtype=problem.family_size.dtype)
+    daily_occ_costs = np.zeros((len(population), problem.n_days))
+    daily_acc_costs = np.zeros((len(population), problem.n_days))
     for i in range(len(population)):
-        occ_cost, daily_occ = occupancy_cost(population[i])
-        acc_cost = accounting_cost(population[i], daily_occ)
+        daily_occ, occ_cost, acc_cost = compute_daily_costs(problem,
+                                                            population[i])
+        daily_occupancies[i, :] = daily_occ
+        daily_occ_costs[i, :] = occ_cost
+        daily_acc_costs[i, :] = acc_cost
+    return daily_occupancies, daily_occ_costs, daily_acc_costs
+
+
+@njit(cache=True)
+def penalize_daily_costs(problem, daily_occupancies, daily_occ_costs,
+                         daily_acc_costs):
+    occ_costs = np.zeros(daily_occ_costs.shape)
+    acc_costs = np.zeros(daily_acc_costs.shape)
+    for i in range(len(daily_occupancies)):
         # Penalization
-        violation_score = compute_violation_score(daily_occ)
-        occ_cost = occ_cost * np.exp(violation_score)
-        acc_cost = acc_cost * np.exp(violation_score)
+        violation_score = compute_violation_score(
+            problem, daily_occupancies[i, :problem.n_days]
+        )
+        occ_costs[i, :] = daily_occ_costs[i] * np.exp(violation_score)
+        acc_costs[i, :] = daily_acc_costs[i] * np.exp(violation_score)
+    return occ_costs, acc_costs
+
+
+@njit(cache=True)
+def computes_occ_acc_costs(problem, population):
+    return penalize_daily_costs(problem,
+                                *computes_daily_states(problem, population))
+
+
+@njit(cache=True)
+def update_daily_state(problem, offspring, parent, changed,
+                       daily_occ, occ_cost, acc_cost, dirty_days):
+    """Updates in place the per-day state of parent into the one of
+    offspring. Only the changed families and the days whose occupancy
+    changed (and their previous day) are recomputed.
+
+    :param changed: mask of the families whose choice may differ from
+                    parent.
+    """
+    dirty_days[:] = False
+    for family_idx in range(len(changed)):
+        if not changed[family_idx]:
+            continue
+        parent_day = parent[family_idx] - 1
+        offspring_day = offspring[family_idx] - 1
+        if parent_day == offspring_day:
+            continue
+        n = problem.family_size[family_idx]
+        costs = problem.cost_matrix[family_idx]
+        daily_occ[parent_day] -= n
+        daily_occ[offspring_day] += n
+        occ_cost[parent_day] -= costs[parent_day]
+        occ_cost[offspring_day] += costs[offspring_day]
+        dirty_days[parent_day] = True
+        dirty_days[offspring_day] = True
+
+    n_days = problem.n_days
+    daily_occ[n_days] = daily_occ[n_days - 1]
+    for day in range(n_days):
+        if dirty_days[day] or dirty_days[day + 1]:
+            acc_cost[day] = day_accounting_cost(problem.accounting_costs,
+                                                problem.min_occupancy,
+                                                problem.accounting_offset,
+                                                daily_occ[day],
+                                                daily_occ[day + 1])
+
+
+@njit(cache=True)
+def update_daily_states(problem, offsprings, parents, parents_idx, changed,
+                        daily_occupancies, daily_occ_costs, daily_acc_costs,
+                        new_daily_occupancies, new_daily_occ_costs,
+                        new_daily_acc_costs):
+    """Writes the per-day states of offsprings in the new_daily_* arrays,
+    starting from the cached states of the parents they come from (see
+    update_daily_state).
+
+    :param offsprings: 2D array of offsprings
+    :param parents: 2D array of parents
+    :param parents_idx: index in parents of the parent of each offspring
+    :param changed: for each offspring, mask of the families whose choice
+                    may differ from its parent.
+    :param daily_occupancies, daily_occ_costs, daily_acc_costs: per-day
+           states of parents (see computes_daily_states)
+    """
+    dirty_days = np.zeros(problem.n_days + 1, dtype=np.bool_)
+    for i in range(len(offsprings)):
+        parent_idx = parents_idx[i]
+        new_daily_occupancies[i] = daily_occupancies[parent_idx]
+        new_daily_occ_costs[i] = daily_occ_costs[parent_idx]
+        new_daily_acc_costs[i] = daily_acc_costs[parent_idx]
+        update_daily_state(problem, offsprings[i], parents[parent_idx],
+                           changed[i], new_daily_occupancies[i],
+                           new_daily_occ_costs[i], new_daily_acc_costs[i],
+                           dirty_days)
+
+
+# Parallel versions of the population kernels. Individuals are scored
+# independently on the threads set by utils.set_n_threads, with the same
+# results as the serial versions.
+
+
+@njit(parallel=True, cache=True)
+def parallel_apply_cost_function(problem, population):
+    scores = np.zeros(len(population))
+    n_violations = np.zeros(len(population))
+    violation_scores = np.zeros(len(population))
+    for i in prange(len(population)):
+        score, n_viol, viol_score = cost_function(problem, population[i])
+        scores[i] = score
+        n_violations[i] = n_viol
+        violation_scores[i] = viol_score
+    return scores, n_violations, violation_scores
+
 
-        occ_costs[i, :] = occ_cost
-        acc_costs[i, :] = acc_cost
+@njit(parallel=True, cache=True)
+def parallel_computes_daily_states(problem, population):
+    daily_occupancies = np.zeros((len(population), problem.n_days + 1),
+                                 dtype=problem.family_size.dtype)
+    daily_occ_costs = np.zeros((len(population), problem.n_days))
+    daily_acc_costs = np.zeros((len(population), problem.n_days))
+    for i in prange(len(population)):
+        daily_occ, occ_cost, acc_cost = compute_daily_costs(problem,
+                                                            population[i])
+        daily_occupancies[i, :] = daily_occ
+        daily_occ_costs[i, :] = occ_cost
+        daily_acc_costs[i, :] = acc_cost
+    return daily_occupancies, daily_occ_costs, daily_acc_costs
+
+
+@njit(parallel=True, cache=True)
+def parallel_penalize_daily_costs(problem, daily_occupancies,
+                                  daily_occ_costs, daily_acc_costs,
+                                  occ_costs, acc_costs, costs_array,
+                                  total_costs):
+    """Writes in place the penalized daily costs of each individual
+    (see penalize_daily_costs), its (occupancy cost, accounting cost) in
+    costs_array and their sum in total_costs.
+    """
+    for i in prange(len(daily_occupancies)):
+        for day in range(problem.n_days):
+            penalty = np.exp(day_violation_score(problem,
+                                                 daily_occupancies[i, day]))
+            occ_costs[i, day] = daily_occ_costs[i, day] * penalty
+            acc_costs[i, day] = daily_acc_costs[i, day] * penalty
+        costs_array[i, 0] = occ_costs[i].sum()
+        costs_array[i, 1] = acc_costs[i].sum()
+        total_costs[i] = costs_array[i, 0] + costs_array[i, 1]
+
+
+@njit(cache=True)
+def parallel_computes_occ_acc_costs(problem, population):
+    daily_occupancies, daily_occ_costs, daily_acc_costs = \
+        parallel_computes_daily_states(problem, population)
+    occ_costs = np.zeros(daily_occ_costs.shape)
+    acc_costs = np.zeros(daily_acc_costs.shape)
+    parallel_penalize_daily_costs(problem, daily_occupancies,
+                                  daily_occ_costs, daily_acc_costs,
+                                  occ_costs, acc_costs,
+                                  np.zeros((len(population), 2)),
+                                  np.zeros(len(population)))
     return occ_costs, acc_costs
 
 
-@njit
-def computes_family_occ_costs(individual):
+@njit(cache=True)
+def parallel_computes_total_costs(problem, population):
+    occ_costs, acc_costs = parallel_computes_occ_acc_costs(problem,
+                                                           population)
+    return occ_costs.sum(axis=1) + acc_costs.sum(axis=1)
+
+
+@njit(parallel=True, cache=True)
+def parallel_update_daily_states(problem, offsprings, parents, parents_idx,
+                                 changed, daily_occupancies, daily_occ_costs,
+                                 daily_acc_costs, new_daily_occupancies,
+                                 new_daily_occ_costs, new_daily_acc_costs):
+    for i in prange(len(offsprings)):
+        parent_idx = parents_idx[i]
+        new_daily_occupancies[i] = daily_occupancies[parent_idx]
+        new_daily_occ_costs[i] = daily_occ_costs[parent_idx]
+        new_daily_acc_costs[i] = daily_acc_costs[parent_idx]
+        dirty_days = np.zeros(problem.n_days + 1, dtype=np.bool_)
+        update_daily_state(problem, offsprings[i], parents[parent_idx],
+                           changed[i], new_daily_occupancies[i],
+                           new_daily_occ_costs[i], new_daily_acc_costs[i],
+                           dirty_days)
+
+
+@njit(cache=True)
+def computes_family_occ_costs(problem, individual):
     costs = np.zeros(len(individual))
     for i in range(len(costs)):
-        costs[i] = cost_matrix[i, individual[i] - 1]
+        costs[i] = problem.cost_matrix[i, individual[i] - 1]
     return costs
 
-@njit
-def computes_total_costs(population):
-    occ_costs, acc_costs = computes_occ_acc_costs(population)
+@njit(cache=True)
+def computes_total_costs(problem, population):
+    occ_costs, acc_costs = computes_occ_acc_costs(problem, population)
     return occ_costs.sum(axis=1) + acc_costs.sum(axis=1)
 
 
-@njit
-def compute_daily_occupancy(individual):
-    daily_occupancy = np.zeros(N_DAYS + 1, dtype=np.int64)
-    for i, (pred, n) in enumerate(zip(individual, family_size)):
+@njit(cache=True)
+def compute_daily_occupancy(problem, individual):
+    daily_occupancy = np.zeros(problem.n_days + 1, dtype=np.int64)
+    for i, (pred, n) in enumerate(zip(individual, problem.family_size)):
         daily_occupancy[pred] += n
     daily_occupancy = daily_occupancy[1:]
     return daily_occupancy
 
 
-@njit
-def compute_violation_score(daily_occupancy):
-    violation_score = np.zeros(N_DAYS, dtype=np.int64)
+@njit(cache=True)
+def compute_violation_score(problem, daily_occupancy):
+    violation_score = np.zeros(len(daily_occupancy), dtype=np.int64)
     for day in range(len(daily_occupancy)):
         n = daily_occupancy[day]
-        violation_score[day] += max(0, n - MAX_OCCUPANCY)
-        violation_score[day] += max(0, MIN_OCCUPANCY - n)
+        violation_score[day] += max(0, n - problem.max_occupancy)
+        violation_score[day] += max(0, problem.min_occupancy - n)
     return violation_score
 
 
-@njit
-def violation_score_variation(family_idx, current_choice, new_choice,
-                              daily_occupancy):
+@njit(cache=True)
+def day_violation_score(problem, n):
+    """Violation score of a day of occupancy n
+    (see compute_violation_score).
+    """
+    return max(0, n - problem.max_occupancy) + \
+        max(0, problem.min_occupancy - n)
+
+
+@njit(cache=True)
+def violation_score_variation(problem, family_idx, current_choice,
+                              new_choice, daily_occupancy):
     occ_current_day = daily_occupancy[current_choice - 1]
     occ_next_day = daily_occupancy[new_choice - 1]
-    current_violation_score = compute_violation_score(
-        [occ_current_day, occ_next_day]
-    )
+    current_violation_score = day_violation_score(problem, occ_current_day) + \
+        day_violation_score(problem, occ_next_day)
 
-    n = family_size[family_idx]
+    n = problem.family_size[family_idx]
     anticipated_occ_current_day = occ_current_day - n
     anticipated_occ_next_day = occ_next_day + n
 
-    next_violation_score = compute_violation_score(
-        [anticipated_occ_current_day, anticipated_occ_next_day]
+    next_violation_score = \
+        day_violation_score(problem, anticipated_occ_current_day) + \
+        day_violation_score(problem, anticipated_occ_next_day)
+
+    return current_violation_score, next_violation_score
+
+
+@njit(cache=True)
+def compute_daily_costs(problem, individual):
+    """Per-day state of an individual used by the delta evaluation:
+    daily occupancy (the last day is repeated at index n_days),
+    daily occupancy cost and daily accounting cost.
+    """
+    daily_occ_cost, daily_occupancy = occupancy_cost(problem, individual)
+    daily_acc_cost = accounting_cost(problem, individual, daily_occupancy)
+    return daily_occupancy, daily_occ_cost, daily_acc_cost
+
+
+@njit(cache=True)
+def penalized_day_cost(occ_cost, acc_cost, n, min_occupancy, max_occupancy):
+    if n >= min_occupancy and n <= max_occupancy:
+        return occ_cost + acc_cost
+    penalty = np.exp(max(0, n - max_occupancy) + max(0, min_occupancy - n))
+    return occ_cost * penalty + acc_cost * penalty
+
+
+@njit(cache=True)
+def moved_occupancy(daily_occupancy, day, day1, n1, day2, n2):
+    n = daily_occupancy[day]
+    if day == day1:
+        n += n1
+    if day == day2:
+        n += n2
+    return n
+
+
+@njit(cache=True)
+def day_cost_variation(accounting_costs, min_occupancy, max_occupancy,
+                       accounting_offset, old_n, n, n_next, old_occ_cost,
+                       occ_cost, old_acc_cost):
+    """Variation of the penalized cost of a day whose occupancy goes from
+    old_n to n (n_next for the next day) and occupancy cost from
+    old_occ_cost to occ_cost.
+    """
+    new_cost = penalized_day_cost(
+        occ_cost,
+        day_accounting_cost(accounting_costs, min_occupancy,
+                            accounting_offset, n, n_next),
+        n, min_occupancy, max_occupancy
     )
+    return new_cost - penalized_day_cost(old_occ_cost, old_acc_cost, old_n,
+                                         min_occupancy, max_occupancy)
+
+
+@njit(cache=True)
+def move_cost_variation(problem, daily_occupancy, daily_occ_cost,
+                        daily_acc_cost, day1, n1, cost1, day2, n2, cost2):
+    """Variation of the total cost when the occupancy of day1 (resp. day2)
+    changes by n1 (resp. n2) and its occupancy cost by cost1 (resp. cost2).
+    Days are 0-based. Only the days whose costs can change are visited:
+    day1 - 1, day1, day2 - 1 and day2.
+    """
+    accounting_costs = problem.accounting_costs
+    min_occupancy = problem.min_occupancy
+    max_occupancy = problem.max_occupancy
+    last_day = problem.n_days - 1
+    variation = 0.
+    for k in range(4):
+        if k == 0:
+            day = day1 - 1
+        elif k == 1:
+            day = day1
+        elif k == 2:
+            day = day2 - 1
+        else:
+            day = day2
+        # Days out of the calendar or already visited
+        if day < 0 or k >= 2 and (day == day1 - 1 or day == day1):
+            continue
+        occ_cost = daily_occ_cost[day]
+        if day == day1:
+            occ_cost += cost1
+        if day == day2:
+            occ_cost += cost2
+        variation += day_cost_variation(
+            accounting_costs, min_occupancy, max_occupancy,
+            problem.accounting_offset, daily_occupancy[day],
+            moved_occupancy(daily_occupancy, day, day1, n1, day2, n2),
+            moved_occupancy(daily_occupancy, min(day + 1, last_day),
+                            day1, n1, day2, n2),
+            daily_occ_cost[day], occ_cost, daily_acc_cost[day]
+        )
+    return variation
+
+
+@njit(cache=True)
+def shift_cost_variation(problem, individual, family_idx, new_choice,
+                         daily_occupancy, daily_occ_cost, daily_acc_cost):
+    """Variation of the total cost when family_idx moves to new_choice."""
+    day1 = individual[family_idx] - 1
+    day2 = new_choice - 1
+    n = problem.family_size[family_idx]
+    return move_cost_variation(
+        problem, daily_occupancy, daily_occ_cost, daily_acc_cost,
+        day1, -n, -problem.cost_matrix[family_idx, day1],
+        day2, n, problem.cost_matrix[family_idx, day2]
+    )
+
 
-    return current_violation_score.sum(), next_violation_score.sum()
+@njit(cache=True)
+def swap_cost_variation(problem, individual, family_idx, swap_idx,
+                        daily_occupancy, daily_occ_cost, daily_acc_cost):
+    """Variation of the total cost when family_idx and swap_idx
+    exchange their days."""
+    day1 = individual[family_idx] - 1
+    day2 = individual[swap_idx] - 1
+    n = problem.family_size[swap_idx] - problem.family_size[family_idx]
+    cost_matrix = problem.cost_matrix
+    return move_cost_variation(
+        problem, daily_occupancy, daily_occ_cost, daily_acc_cost,
+        day1, n, cost_matrix[swap_idx, day1] - cost_matrix[family_idx, day1],
+        day2, -n, cost_matrix[family_idx, day2] - cost_matrix[swap_idx, day2]
+    )
 
 
-@njit
-def family_distance(family1, family2):
+@njit(cache=True)
+def apply_move(problem, individual, family_idx, new_choice, swap_idx,
+               daily_occupancy, daily_occ_cost, daily_acc_cost):
+    """Applies a shift (swap_idx < 0) or a swap in place on the individual
+    and on its per-day state.
+    """
+    day1 = individual[family_idx] - 1
+    day2 = new_choice - 1
+    n = problem.family_size[family_idx]
+    daily_occupancy[day1] -= n
+    daily_occupancy[day2] += n
+    daily_occ_cost[day1] -= problem.cost_matrix[family_idx, day1]
+    daily_occ_cost[day2] += problem.cost_matrix[family_idx, day2]
+    individual[family_idx] = new_choice
+    if swap_idx >= 0:
+        n = problem.family_size[swap_idx]
+        daily_occupancy[day2] -= n
+        daily_occupancy[day1] += n
+        daily_occ_cost[day2] -= problem.cost_matrix[swap_idx, day2]
+        daily_occ_cost[day1] += problem.cost_matrix[swap_idx, day1]
+        individual[swap_idx] = day1 + 1
+    n_days = problem.n_days
+    for day in (day1 - 1, day1, day2 - 1, day2):
+        if day >= 0:
+            daily_acc_cost[day] = day_accounting_cost(
+                problem.accounting_costs, problem.min_occupancy,
+                problem.accounting_offset, daily_occupancy[day],
+                daily_occupancy[min(day + 1, n_days - 1)]
+            )
+    daily_occupancy[n_days] = daily_occupancy[n_days - 1]
+
+
+@njit(cache=True)
+def daily_total_cost(problem, daily_occupancy, daily_occ_cost,
+                     daily_acc_cost):
+    """Total cost from the per-day state, summed in the same order as
+    computes_total_costs so that both give exactly the same score.
+    """
+    penalty = np.exp(compute_violation_score(
+        problem, daily_occupancy[:problem.n_days]
+    ))
+    return (daily_occ_cost * penalty).sum() + \
+        (daily_acc_cost * penalty).sum()
+
+
+@njit(cache=True)
+def family_distance(family1, family2, weights, max_similarity_distance):
     """Distance between two family defined as the cost
     for Santa Claus to replace family1'choices by
     family2's choices."""
@@ -164,10 +527,47 @@ def family_distance(family1, family2):
         if idx_choice_family2 >= 0:
             similarity_distance += np.exp(weights[idx1]) * np.abs(idx_choice_family2 - idx1)
         else:
-            similarity_distance += np.exp(weights[idx1]) * 10
+            similarity_distance += np.exp(weights[idx1]) * len(family2)
 
     similarity_distance /= max_similarity_distance
 
     # mae = np.abs(family1 - family2).mean() / 90
 
     return similarity_distance
+
+
+@njit(parallel=True, cache=True)
+def family_neighbors(problem, k):
+    """Indices of the k closest families of each family (itself excluded)
+    for family_distance, from the closest. Distances are computed from the
+    position of each day in the choices of each family rather than by
+    searching the choices.
+    """
+    data_array = problem.data_array
+    n_families, n_choices = data_array.shape
+    # Position of each day in the choices of each family, -1 if absent.
+    positions = -np.ones((n_families, problem.n_days + 1), dtype=np.int64)
+    for family_idx in range(n_families):
+        for idx in range(n_choices):
+            positions[family_idx, data_array[family_idx, idx]] = idx
+    exp_weights = np.exp(problem.weights)
+    neighbors = np.empty((n_families, k), dtype=np.int64)
+    for family_idx in prange(n_families):
+        distances = np.empty(n_families)
+        for other_idx in range(n_families):
+            similarity_distance = 0.
+            for idx1 in range(n_choices):
+                idx2 = positions[other_idx, data_array[family_idx, idx1]]
+                if idx2 >= 0:
+                    similarity_distance += exp_weights[idx1] * abs(idx2 - idx1)
+                else:
+                    similarity_distance += exp_weights[idx1] * n_choices
+            distances[other_idx] = similarity_distance
+        distances[family_idx] = np.inf
+        # Sorts only the families closer than the k-th one.
+        candidates = np.nonzero(
+            distances <= np.partition(distances, k - 1)[k - 1]
+        )[0]
+        order = np.argsort(distances[candidates], kind='mergesort')
+        neighbors[family_idx] = candidates[order[:k]]
+    return neighbors
@@ -0,0 +1,105 @@
+from functools import partial
+from multiprocessing import get_context
+import time
+
+import numpy as np
+
+from initializations import (generate_random_individual,
+                             generate_relaxed_individual)
+from load_data_and_constants import attach_problem, get_problem, share_problem
+from utils import seed_compiled_functions, set_n_threads
+
+# Problem of the worker process, attached to the shared memory blocks of
+# the driver by initialize_worker.
+worker_problem = None
+worker_blocks = []
+
+
+def initialize_worker(descriptors, n_threads):
+    global worker_problem, worker_blocks
+    worker_problem, worker_blocks = attach_problem(descriptors)
+    set_n_threads(n_threads)
+
+
+def run_search(solver, seed, initial_solution, run_kwargs,
+               initializer=generate_random_individual):
+    """Runs one search of solver in a worker process.
+
+    :return: best solution found and statistics of the run.
+    """
+    np.random.seed(seed)
+    seed_compiled_functions(seed)
+    start = time.perf_counter()
+    if initial_solution is None:
+        initial_solution = initializer(worker_problem)
+    search = solver(worker_problem, initial_solution)
+    initial_score = search.best_score
+    search.run(**run_kwargs)
+    return search.best_solution, {
+        'seed': seed,
+        'initial_score': initial_score,
+        'best_score': search.best_score,
+        'n_iterations': search.iter,
+        'time': time.perf_counter() - start
+    }
+
+
+def multi_start(solver, n_runs, run_kwargs, initial_solutions=None,
+                n_workers=None, seed=0, problem=None,
+                initializer=generate_random_individual, n_threads=1):
+    """Runs n_runs independent searches of solver (TabuSearch or
+    DynamicTabuSearch) on a process pool. The problem arrays are shared
+    with the workers instead of being pickled to each of them.
+
+    :param run_kwargs: keyword arguments of solver.run
+    :param initial_solutions: initial solution of each run, given by
+                              initializer if None.
+    :param initializer: function of the problem returning an initial
+                        solution, called in the worker process after
+                        seeding it (e.g. generate_relaxed_individual with
+                        some noise).
+    :param n_workers: number of processes, all available cores if None.
+    :param n_threads: threads of the parallel kernels in each process, so
+                      that the processes do not oversubscribe the cores.
+    :param seed: run i is seeded with seed + i.
+    :return: best solution, its score and the statistics of each run,
+             in the order of the runs.
+    """
+    problem = get_problem() if problem is None else problem
+    if initial_solutions is None:
+        initial_solutions = [None] * n_runs
+    tasks = [(solver, seed + i, initial_solutions[i], run_kwargs,
+              initializer)
+             for i in range(n_runs)]
+    blocks, descriptors = share_problem(problem)
+    best_solution = None
+    best_score = np.inf
+    stats = []
+    try:
+        with get_context().Pool(n_workers, initializer=initialize_worker,
+                                initargs=(descriptors, n_threads)) as pool:
+            for solution, run_stats in pool.starmap(run_search, tasks):
+                if run_stats['best_score'] < best_score:
+                    best_solution = solution
+                    best_score = run_stats['best_score']
+                stats.append(run_stats)
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+    return best_solution, best_score, stats
+
+
+if __name__ == '__main__':
+    from tabu_search import TabuSearch
+
+    best_solution, best_score, stats = multi_start(
+        TabuSearch, n_runs=8,
+        run_kwargs={'iter_max': 10, 'neighborhood_size': 50,
+                    'tabu_duration': 10, 'n_iter_without_improvement': 5},
+        initializer=partial(generate_relaxed_individual, noise=1.)
+    )
+    for run_stats in stats:
+        print(run_stats)
+    print(f'Best score: {best_score}')
+    np.save('data/best_solution_multi_start.npy', best_solution)
@@ -1,12 +1,13 @@
-from numba import njit, jit
+from numba import njit, jit, prange
 from tqdm import tqdm
 import numpy as np
 
-from metrics import computes_family_occ_costs, computes_total_costs
-from load_data_and_constants import N_DAYS, cost_matrix
+from metrics import (computes_family_occ_costs, compute_daily_costs,
+                     shift_cost_variation, swap_cost_variation,
+                     apply_move, daily_total_cost)
 
 
-@njit
+@njit(cache=True)
 def is_feasible(assignment_ref: tuple([int, int]),
                 tabu_matrix: np.array,
                 iter: int) -> bool:
@@ -15,68 +16,120 @@ def is_feasible(assignment_ref: tuple([int, int]),
     return tabu_matrix[assignment_ref[0], assignment_ref[1] - 1] < iter
 
 
-@njit
-def get_shifts(solution: np.array, family_idx: int,
+@njit(cache=True)
+def get_shifts(problem, solution: np.array, family_idx: int,
+               daily_costs: tuple,
                tabu_matrix: np.array,
-               iter: int) -> tuple([list, list]):
+               iter: int) -> tuple([np.array, np.array, np.array]):
     """
     Finds new assignments of family_idx resulting from switching its choice
-    with all other days.
+    with all other days. Candidates are not built: each move is scored by its
+    cost variation (see metrics.shift_cost_variation).
 
     :param solution: 1D solution array
     :param family_idx: index mapping a family choice in solution
+    :param daily_costs: per-day state of solution
+                        (see metrics.compute_daily_costs)
+    :return: moves (family_idx, new_choice, swap_idx), cost variations and
+             assignments references.
     """
+    daily_occupancy, daily_occ_cost, daily_acc_cost = daily_costs
     current_choice = solution[family_idx]
-    shifts = []
-    assignments_ref = []
-    for new_choice in range(1, N_DAYS + 1):
+    n_days = problem.n_days
+    moves = np.empty((n_days, 3), dtype=np.int64)
+    variations = np.empty(n_days)
+    assignments_ref = np.empty((n_days, 2), dtype=np.int64)
+    n_moves = 0
+    for new_choice in range(1, n_days + 1):
         if (new_choice != current_choice) & \
                 is_feasible((family_idx, new_choice), tabu_matrix, iter):
-            shift = solution.copy()
-            shift[family_idx] = new_choice
-            shifts.append(shift)
+            moves[n_moves] = (family_idx, new_choice, -1)
+            variations[n_moves] = shift_cost_variation(
+                problem, solution, family_idx, new_choice,
+                daily_occupancy, daily_occ_cost, daily_acc_cost
+            )
             # Keeps in memory the assignment.
-            assignments_ref.append((family_idx, new_choice))
-    return shifts, assignments_ref
+            assignments_ref[n_moves] = (family_idx, new_choice)
+            n_moves += 1
+    return (moves[:n_moves], variations[:n_moves],
+            assignments_ref[:n_moves])
 
 
-@njit
-def get_swaps(solution: np.array, family_idx: int,
+@njit(parallel=True, cache=True)
+def get_swaps(problem, solution: np.array, family_idx: int,
+              daily_costs: tuple,
               tabu_matrix: np.array,
-              iter: int) -> tuple([list, list]):
+              iter: int) -> tuple([np.array, np.array, np.array]):
     """
     Finds all new assignments of family_idx resulting from swapping its choices
-    with the choices of all other families.
+    with the choices of all other families. Candidates are not built: each
+    move is scored by its cost variation (see metrics.swap_cost_variation),
+    in parallel over the other families (see utils.set_n_threads).
 
     :param solution: 1D solution array
     :param family_idx: index mapping a family choice in solution
+    :param daily_costs: per-day state of solution
+                        (see metrics.compute_daily_costs)
+    :return: moves (family_idx, new_choice, swap_idx), cost variations and
+             assignments references.
     """
-    swaps = []
-    assignments_ref = []
+    daily_occupancy, daily_occ_cost, daily_acc_cost = daily_costs
+    n_families = len(solution)
+    feasible = np.zeros(n_families, dtype=np.bool_)
+    variations = np.empty(n_families)
+    assignments_ref = np.empty((n_families, 2), dtype=np.int64)
     current_choice = solution[family_idx]
-    for swap_idx in range(len(solution)):
-        if swap_idx != family_idx: 
-            swap = solution.copy()
-            new_choice = swap[swap_idx]
-            swap[family_idx] = new_choice
-            swap[swap_idx] = current_choice
+    cost_matrix = problem.cost_matrix
+    for swap_idx in prange(n_families):
+        if swap_idx != family_idx:
+            new_choice = solution[swap_idx]
 
             # Keeps in memory only the assignment with the highest cost
             if cost_matrix[family_idx, new_choice - 1] > \
                     cost_matrix[swap_idx, current_choice - 1]:
-                if is_feasible((family_idx, new_choice), tabu_matrix, iter):
-                    swaps.append(swap)
-                    assignments_ref.append((family_idx, new_choice))
+                assignments_ref[swap_idx, 0] = family_idx
+                assignments_ref[swap_idx, 1] = new_choice
             else:
-                if is_feasible((swap_idx, current_choice), tabu_matrix, iter):
-                    swaps.append(swap)
-                    assignments_ref.append((swap_idx, current_choice))
-
-    return swaps, assignments_ref
-
-
-@njit
-def find_best_new_assignment(solution: np.array, family_idx: int,
+                assignments_ref[swap_idx, 0] = swap_idx
+                assignments_ref[swap_idx, 1] = current_choice
+
+            if is_feasible((assignments_ref[swap_idx, 0],
+                            assignments_ref[swap_idx, 1]),
+                           tabu_matrix, iter):
+                feasible[swap_idx] = True
+                variations[swap_idx] = swap_cost_variation(
+                    problem, solution, family_idx, swap_idx,
+                    daily_occupancy, daily_occ_cost, daily_acc_cost
+                )
+
+    swap_idx = np.nonzero(feasible)[0]
+    moves = np.empty((len(swap_idx), 3), dtype=np.int64)
+    moves[:, 0] = family_idx
+    moves[:, 1] = solution[swap_idx]
+    moves[:, 2] = swap_idx
+    return moves, variations[swap_idx], assignments_ref[swap_idx]
+
+
+@njit(cache=True)
+def move_score(problem, solution: np.array, move: np.array,
+               daily_costs: tuple):
+    """Exact total cost of solution after move, computed from a copy of the
+    per-day state only.
+    """
+    daily_occupancy, daily_occ_cost, daily_acc_cost = daily_costs
+    individual = solution.copy()
+    daily_occupancy = daily_occupancy.copy()
+    daily_occ_cost = daily_occ_cost.copy()
+    daily_acc_cost = daily_acc_cost.copy()
+    apply_move(problem, individual, move[0], move[1], move[2],
+               daily_occupancy, daily_occ_cost, daily_acc_cost)
+    return daily_total_cost(problem, daily_occupancy, daily_occ_cost,
+                            daily_acc_cost)
+
+
+@njit(cache=True)
+def find_best_new_assignment(problem, solution: np.array, family_idx: int,
+                             daily_costs: tuple,
                              tabu_matrix, iter):
     """
     Lists all new feasible assignments for a given family_idx. Evaluate them
@@ -84,29 +137,38 @@ def find_best_new_assignment(solution: np.array, family_idx: int,
 
     :param solution: 1D solution array
     :param family_idx: index mapping a family choice in solution
+    :param daily_costs: per-day state of solution
+                        (see metrics.compute_daily_costs)
+    :return: best move (family_idx, new_choice, swap_idx), its score,
+             its assignment reference and the number of moves evaluated.
     """
-    shifts, shift_assignments_ref = get_shifts(
-        solution, family_idx,
+    shifts, shift_variations, shift_assignments_ref = get_shifts(
+        problem, solution, family_idx, daily_costs,
         tabu_matrix, iter
     )
-    swaps, swap_assignments_ref = get_swaps(
-        solution, family_idx,
+    swaps, swap_variations, swap_assignments_ref = get_swaps(
+        problem, solution, family_idx, daily_costs,
         tabu_matrix, iter
     )
-    assignments = shifts + swaps
-    assignments_ref = shift_assignments_ref + swap_assignments_ref
+    moves = np.concatenate((shifts, swaps))
+    variations = np.concatenate((shift_variations, swap_variations))
+    assignments_ref = np.concatenate((shift_assignments_ref,
+                                      swap_assignments_ref))
+    if len(moves) == 0:
+        return (np.zeros(3, dtype=np.int64), np.inf,
+                np.zeros(2, dtype=np.int64), 0)
 
-    assignment_scores = computes_total_costs(assignments)
-    best_assignment_arg = np.argmin(assignment_scores)
-    best_assignment = assignments[best_assignment_arg]
-    best_assignment_score = assignment_scores[best_assignment_arg]
-    best_assignments_ref = assignments_ref[best_assignment_arg]
+    best_move_arg = np.argmin(variations)
+    best_move = moves[best_move_arg]
+    best_move_score = move_score(problem, solution, best_move,
+                                 daily_costs)
+    best_assignments_ref = assignments_ref[best_move_arg]
 
-    return best_assignment, best_assignment_score, best_assignments_ref
+    return best_move, best_move_score, best_assignments_ref, len(moves)
 
 
-def get_neighbor(solution: np.array, fixed_assignments: list,
-                 best_score: float,
+def get_neighbor(problem, solution: np.array, fixed_assignments: list,
+                 best_score: float, neighborhood_size: int,
                  tabu_matrix, iter) -> np.array:
     """Neighbor generation mechanism
 
@@ -114,28 +176,40 @@ def get_neighbor(solution: np.array, fixed_assignments: list,
     :param fixed_assignments: list of family indices that can't be mutated
                               during the neighbor research.
     :param best_score: best score so far.
-    :return: a new solution array
+    :param neighborhood_size: maximum number of families explored.
+    :return: a new solution array, its score, the assignment made tabu and
+             the number of moves evaluated.
     """
 
-    family_costs = computes_family_occ_costs(solution)
+    family_costs = computes_family_occ_costs(problem, solution)
     sort_idx = np.argsort(-family_costs)
+    fixed_assignments = set(fixed_assignments)
     sort_idx = [idx for idx in sort_idx if idx not in fixed_assignments]
     if len(sort_idx) == 0:
-        return solution, best_score, []
+        return solution, best_score, [], 0
+    daily_costs = compute_daily_costs(problem, solution)
     best_neighbor_score = np.inf
-    best_neighbor = None
+    best_neighbor_move = None
     best_neighbor_assignment = None
-    n = min(500, len(sort_idx))
+    n_moves = 0
+    n = min(neighborhood_size, len(sort_idx))
     for family_idx in sort_idx[:n]:
-        best_assignment, best_assignment_score, best_assignments_ref = \
-            find_best_new_assignment(solution, family_idx,
-                                     tabu_matrix, iter)
-
-        if best_assignment_score < best_neighbor_score:
-            best_neighbor_score = best_assignment_score
-            best_neighbor = best_assignment
+        best_move, best_move_score, best_assignments_ref, n_family_moves = \
+            find_best_new_assignment(problem, solution, family_idx,
+                                     daily_costs, tabu_matrix, iter)
+        n_moves += n_family_moves
+
+        if best_move_score < best_neighbor_score:
+            best_neighbor_score = best_move_score
+            best_neighbor_move = best_move
             best_neighbor_assignment = best_assignments_ref
         if best_neighbor_score < best_score:
             break
 
-    return best_neighbor, best_neighbor_score, best_neighbor_assignment
+    if best_neighbor_move is None:
+        return solution, best_score, [], n_moves
+    best_neighbor = solution.copy()
+    apply_move(problem, best_neighbor, *best_neighbor_move, *daily_costs)
+
+    return (best_neighbor, best_neighbor_score, best_neighbor_assignment,
+            n_moves)
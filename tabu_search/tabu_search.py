@@ -1,7 +1,10 @@
 import numpy as np
 
+from checkpoints import Checkpoint
 from tabu_search.neighborhood import get_neighbor
+from load_data_and_constants import as_solution
 from metrics import computes_total_costs
+from telemetry import NULL_RECORDER
 
 # From:
 # A Tabu search heuristic for the generalized assignment problem
@@ -9,13 +12,31 @@ from metrics import computes_total_costs
 
 
 class TabuSearch():
-    def __init__(self, initial_solution):
+    STATS_FIELDS = ('iter', 'score', 'best_score')
+
+    def __init__(self, problem, initial_solution, checkpoint_path=None,
+                 recorder=NULL_RECORDER):
+        """
+        :param checkpoint_path: directory where the state of the search is
+                                saved after each phase, and from which run
+                                resumes (see checkpoints.Checkpoint).
+        :param recorder: records iterations and phase times
+                         (see telemetry.Recorder), nothing by default.
+        """
+        self.problem = problem
         self.n_families = initial_solution.shape[0]
-        self.n_days = initial_solution.max() + 1
-        self.best_score = computes_total_costs([initial_solution])[0]
+        self.n_days = problem.n_days
+        # Solutions are kept in the compact type of the problem
+        initial_solution = as_solution(problem, initial_solution)
+        self.best_score = computes_total_costs(problem, [initial_solution])[0]
         self.best_solution = initial_solution.copy()
-        self.solution = initial_solution.copy()
+        self.solution = initial_solution
         self.iter = 0
+        self.recorder = recorder
+        # Completed intensification / diversification cycles
+        self.n_cycles = 0
+        self.checkpoint = None if checkpoint_path is None else \
+            Checkpoint(checkpoint_path, self.STATS_FIELDS)
         self.initialize_tabu_matrix()
         self.initialize_frequency_matrix()
         self.unfix_all_assignments()
@@ -23,19 +44,28 @@ class TabuSearch():
     def short_term_memory_phase(self):
         i = 0
         while i <= self.n_iter_without_improvement:
-            neighbor, neighbor_score, assignment = get_neighbor(
-                self.solution,
-                self.fixed_assignments,
-                self.best_score,
-                self.neighborhood_size,
-                self.tabu_matrix,
-                self.iter
-            )
+            with self.recorder.phase('evaluation'):
+                neighbor, neighbor_score, assignment, n_moves = get_neighbor(
+                    self.problem,
+                    self.solution,
+                    self.fixed_assignments,
+                    self.best_score,
+                    self.neighborhood_size,
+                    self.tabu_matrix,
+                    self.iter
+                )
 
             self.solution = neighbor.copy()
             self.update_tabu_matrix(assignment)
             self.update_frequency_matrix(neighbor)
-            print(f'Iteration {self.iter} - Score: {neighbor_score}')
+            self.recorder.record(self.iter, neighbor_score,
+                                 min(neighbor_score, self.best_score),
+                                 n_moves)
+            if self.checkpoint is not None:
+                self.checkpoint.append_stats(
+                    self.iter, neighbor_score,
+                    min(neighbor_score, self.best_score)
+                )
             self.iter += 1
             i += 1
 
@@ -45,15 +75,15 @@ class TabuSearch():
                 break
 
     def intensification_phase(self):
-        print('Intensification phase')
-        self.solution = self.best_solution.copy()
-        self.fix_most_frequent_assignments(self.solution)
-        self.short_term_memory_phase()
+        with self.recorder.phase('intensification'):
+            self.solution = self.best_solution.copy()
+            self.fix_most_frequent_assignments(self.solution)
+            self.short_term_memory_phase()
 
     def diversification_phase(self):
-        print('Diversification phase')
-        self.unfix_all_assignments()
-        self.short_term_memory_phase()
+        with self.recorder.phase('diversification'):
+            self.unfix_all_assignments()
+            self.short_term_memory_phase()
 
     def fix_most_frequent_assignments(self, solution):
         """Fix assignments of a given solution based on their frequency.
@@ -83,16 +113,59 @@ class TabuSearch():
     def initialize_frequency_matrix(self):
         self.frequency_matrix = np.ones((self.n_families, self.n_days))
 
+    def save_checkpoint(self):
+        if self.checkpoint is None:
+            return
+        self.checkpoint.save(
+            arrays={
+                'solution': self.solution,
+                'best_solution': self.best_solution,
+                'tabu_matrix': self.tabu_matrix,
+                'frequency_matrix': self.frequency_matrix,
+                'fixed_assignments': np.array(self.fixed_assignments,
+                                              dtype=np.int64)
+            },
+            values={
+                'best_score': float(self.best_score),
+                'iter': self.iter,
+                'n_cycles': self.n_cycles
+            }
+        )
+
+    def resume(self):
+        """Restores the state of the last checkpoint.
+
+        :return: False if there is no checkpoint.
+        """
+        state = None if self.checkpoint is None else self.checkpoint.load()
+        if state is None:
+            return False
+        arrays, values = state
+        self.solution = as_solution(self.problem, arrays['solution'])
+        self.best_solution = as_solution(self.problem,
+                                         arrays['best_solution'])
+        self.tabu_matrix = np.array(arrays['tabu_matrix'])
+        self.frequency_matrix = np.array(arrays['frequency_matrix'])
+        self.fixed_assignments = arrays['fixed_assignments'].tolist()
+        self.best_score = values['best_score']
+        self.iter = values['iter']
+        self.n_cycles = values['n_cycles']
+        return True
+
     def run(self, iter_max, neighborhood_size,
             tabu_duration, n_iter_without_improvement):
         self.tabu_duration = tabu_duration
         self.n_iter_without_improvement = n_iter_without_improvement
         self.neighborhood_size = neighborhood_size
-        print(f'Initial score: {self.best_score}')
-        self.short_term_memory_phase()
-        for i in range(iter_max):
+        if self.resume():
+            print(f'Resumed at iteration {self.iter} - '
+                  f'Best score: {self.best_score}')
+        else:
+            print(f'Initial score: {self.best_score}')
+            self.short_term_memory_phase()
+            self.save_checkpoint()
+        for i in range(self.n_cycles, iter_max):
             self.intensification_phase()
             self.diversification_phase()
-
-    def save_solution(self):
-        np.save('data/best_solution_ts.npy', self.best_solution)
+            self.n_cycles = i + 1
+            self.save_checkpoint()
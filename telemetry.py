@@ -0,0 +1,128 @@
+from contextlib import contextmanager, nullcontext
+import json
+import os
+import time
+
+import numpy as np
+
+RECORD_DTYPE = np.dtype([('time', np.float64), ('iter', np.int64),
+                         ('score', np.float64), ('best_score', np.float64),
+                         ('n_moves', np.int64)])
+
+
+class Recorder():
+    """Records the iterations of a run (score, best score and number of
+    moves or individuals evaluated) in an in-memory ring buffer of
+    capacity records, the time spent in each phase of the solver and
+    named counters (e.g. the hits of a cache).
+
+    :param log_path: if given, every record is also appended to this file
+                     as a json line, followed by the summary on close.
+    :param print_every: prints one iteration out of print_every, never
+                        if 0.
+    """
+
+    def __init__(self, capacity=100000, log_path=None, print_every=0):
+        self.records = np.zeros(capacity, dtype=RECORD_DTYPE)
+        self.n_records = 0
+        self.n_moves = 0
+        self.phase_times = {}
+        self.phase_counts = {}
+        self.counters = {}
+        self.print_every = print_every
+        self.start_time = time.perf_counter()
+        self.log_file = None
+        if log_path is not None:
+            os.makedirs(os.path.dirname(log_path) or '.', exist_ok=True)
+            self.log_file = open(log_path, 'a')
+
+    @contextmanager
+    def phase(self, name):
+        """Adds the time spent in the block to phase name."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phase_times[name] = self.phase_times.get(name, 0.) + \
+                time.perf_counter() - start
+            self.phase_counts[name] = self.phase_counts.get(name, 0) + 1
+
+    def count(self, name, n=1):
+        """Adds n to counter name."""
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def record(self, iter, score, best_score, n_moves=0):
+        elapsed = time.perf_counter() - self.start_time
+        self.records[self.n_records % len(self.records)] = (
+            elapsed, iter, score, best_score, n_moves
+        )
+        self.n_records += 1
+        self.n_moves += n_moves
+        if self.log_file is not None:
+            self.log_file.write(json.dumps({
+                'time': elapsed, 'iter': int(iter), 'score': float(score),
+                'best_score': float(best_score), 'n_moves': int(n_moves)
+            }) + '\n')
+        if self.print_every and iter % self.print_every == 0:
+            print(f'Iteration {iter} - Score: {score} - '
+                  f'Best score: {best_score}')
+
+    def last_records(self):
+        """Records still in the ring buffer, from the oldest."""
+        if self.n_records <= len(self.records):
+            return self.records[:self.n_records]
+        start = self.n_records % len(self.records)
+        return np.concatenate([self.records[start:], self.records[:start]])
+
+    def summary(self):
+        """Throughput, time per phase and improvement rate (decrease of the
+        best score per second over the records in the ring buffer).
+        """
+        elapsed = time.perf_counter() - self.start_time
+        records = self.last_records()
+        improvement_rate = 0.
+        if len(records) > 1 and records[-1]['time'] > records[0]['time']:
+            improvement_rate = (
+                (records[0]['best_score'] - records[-1]['best_score']) /
+                (records[-1]['time'] - records[0]['time'])
+            )
+        return {
+            'time': elapsed,
+            'n_iterations': self.n_records,
+            'n_moves': self.n_moves,
+            'moves_per_second': self.n_moves / elapsed if elapsed > 0 else 0.,
+            'best_score': float(records[-1]['best_score'])
+            if len(records) else np.inf,
+            'improvement_rate': float(improvement_rate),
+            'phase_times': dict(self.phase_times),
+            'phase_counts': dict(self.phase_counts),
+            'counters': dict(self.counters)
+        }
+
+    def close(self):
+        if self.log_file is not None:
+            self.log_file.write(json.dumps({'summary': self.summary()}) +
+                                '\n')
+            self.log_file.close()
+            self.log_file = None
+
+
+class NullRecorder():
+    """Recorder that records nothing, used when telemetry is disabled."""
+
+    null_phase = nullcontext()
+
+    def phase(self, name):
+        return self.null_phase
+
+    def count(self, name, n=1):
+        pass
+
+    def record(self, iter, score, best_score, n_moves=0):
+        pass
+
+    def close(self):
+        pass
+
+
+NULL_RECORDER = NullRecorder()
@@ -1,32 +1,16 @@
-from numba import njit
+from numba import config, njit, set_num_threads
 import numpy as np
-import pickle
 
 
-def save_assets(best_population, mean_scores,
-                best_scores, min_scores):
-
-    pickle.dump(best_population,
-                open('data/evolution_results/best_population.pkl', 'wb')
-                )
-    pickle.dump(mean_scores,
-                open('data/evolution_results/mean_scores.pkl', 'wb')
-                )
-    pickle.dump(best_scores,
-                open('data/evolution_results/best_scores.pkl', 'wb')
-                )
-    pickle.dump(min_scores,
-                open('data/evolution_results/min_scores.pkl', 'wb')
-                )
-
-
-def restore_assets(path: str):
-    population = pickle.load(
-        open(path, 'rb'))
-    return np.array(population)
+def set_n_threads(n_threads=None):
+    """Sets the number of threads used by the parallel kernels,
+    all available cores if n_threads is None.
+    """
+    set_num_threads(config.NUMBA_NUM_THREADS if n_threads is None
+                    else n_threads)
 
 
-@njit
+@njit(cache=True)
 def proportional_random_choice(arr, size):
     """
     :param arr: A 1D numpy array of values to sample from.
@@ -41,3 +25,11 @@ def proportional_random_choice(arr, size):
     uniform_samples = np.random.rand(size)
     index = np.searchsorted(cumulative_distribution, uniform_samples, side="right")
     return index
+
+
+@njit(cache=True)
+def seed_compiled_functions(seed):
+    """Seeds the random generator of numba compiled functions, which is
+    distinct from numpy's.
+    """
+    np.random.seed(seed)
@@ -2,11 +2,12 @@ from matplotlib import pyplot as plt
 import numpy as np
 
 from metrics import computes_occ_acc_costs
-from .evaluation import dominates, fast_non_dominated_sort
+from genetic_algoritms.nsgaII.evaluation import (dominates,
+                                                 fast_non_dominated_sort)
 
 
-def domination_plot(population, index, log=True):
-    occ_costs, acc_costs = computes_occ_acc_costs(population)
+def domination_plot(problem, population, index, log=True):
+    occ_costs, acc_costs = computes_occ_acc_costs(problem, population)
     dominations = []
     for individual in population:
         dominations.append(dominates(
@@ -25,16 +26,23 @@ def domination_plot(population, index, log=True):
     plt.ylabel('Accounting Cost')
 
 
-def domination_fronts_plot(population, log=True):
-    front_groups = fast_non_dominated_sort(population)
-    occ_costs, acc_costs = computes_occ_acc_costs(population)
-    if log:
-        occ_costs = np.log(occ_costs)
-        acc_costs = np.log(acc_costs)
-
+def domination_fronts_plot(archive, costs_array=None, log=True):
+    """Plots the Pareto front kept by archive (see
+    nsgaII.archive.ParetoArchive), over the fronts of costs_array if given,
+    e.g. the costs of the current population as computed by the solver, so
+    that nothing is scored again.
+    """
     plt.figure()
-    for group in front_groups:
-        plt.scatter(
-            np.asarray(occ_costs)[group],
-            np.asarray(acc_costs)[group]
-        )
+    if costs_array is not None:
+        front_groups, _ = fast_non_dominated_sort(costs_array)
+        for group in front_groups:
+            plt.scatter(costs_array[group, 0], costs_array[group, 1], s=8)
+    archive_costs = archive.costs_array
+    plt.step(archive_costs[:, 0], archive_costs[:, 1], where='post',
+             c='black', marker='o', label='Archive')
+    if log:
+        plt.xscale('log')
+        plt.yscale('log')
+    plt.legend()
+    plt.xlabel('Occupation Cost')
+    plt.ylabel('Accounting Cost')
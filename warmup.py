@@ -0,0 +1,163 @@
+from contextlib import contextmanager
+import time
+
+from numba import typeof, types
+from numba.core import event
+
+import initializations
+import metrics
+import utils
+from genetic_algoritms import crossovers, mutations, repairs
+from dynamic_tabu_search import tabu_memory
+from genetic_algoritms.nsgaII import evaluation
+from load_data_and_constants import get_problem
+from tabu_search import neighborhood
+
+# Every kernel is compiled with cache=True: the first compilation of a
+# signature is written next to the sources (or in NUMBA_CACHE_DIR) and later
+# processes only load it.
+
+costs_type = types.float64[:, ::1]
+# Families changed in each offspring
+mask_type = types.boolean[:, ::1]
+
+
+def kernel_signatures(problem):
+    """Hot kernels with the argument types they are called with by the
+    solvers. The problem type depends on the instance arrays, as do the
+    types of the solutions and occupancies (see
+    load_data_and_constants.compact_arrays).
+    """
+    problem_type = typeof(problem)
+    day_type = typeof(problem.data_array).dtype
+    occupancy_type = typeof(problem.family_size).dtype
+    individual_type = day_type[::1]
+    population_type = day_type[:, ::1]
+    occupancies_type = occupancy_type[:, ::1]
+    individuals_list_type = types.List(individual_type, reflected=True)
+    daily_costs_type = types.Tuple((types.int64[::1], types.float64[::1],
+                                    types.float64[::1]))
+    return [
+        # Evaluation
+        (metrics.computes_total_costs, (problem_type, population_type)),
+        (metrics.computes_total_costs, (problem_type, individuals_list_type)),
+        (metrics.computes_occ_acc_costs, (problem_type, population_type)),
+        (metrics.apply_cost_function, (problem_type, population_type)),
+        (metrics.computes_family_occ_costs, (problem_type, individual_type)),
+        (metrics.computes_daily_states, (problem_type, population_type)),
+        (metrics.penalize_daily_costs,
+         (problem_type, occupancies_type, costs_type, costs_type)),
+        (metrics.update_daily_states,
+         (problem_type, population_type, population_type, types.int64[::1],
+          mask_type, occupancies_type, costs_type, costs_type,
+          occupancies_type, costs_type, costs_type)),
+        (metrics.compute_daily_costs, (problem_type, individual_type)),
+        (metrics.parallel_apply_cost_function,
+         (problem_type, population_type)),
+        (metrics.parallel_computes_total_costs,
+         (problem_type, population_type)),
+        (metrics.parallel_computes_daily_states,
+         (problem_type, population_type)),
+        (metrics.parallel_penalize_daily_costs,
+         (problem_type, occupancies_type, costs_type, costs_type, costs_type,
+          costs_type, costs_type, types.float64[::1])),
+        (metrics.parallel_update_daily_states,
+         (problem_type, population_type, population_type, types.int64[::1],
+          mask_type, occupancies_type, costs_type, costs_type,
+          occupancies_type, costs_type, costs_type)),
+        (metrics.apply_move,
+         (problem_type, individual_type, types.int64, types.int64,
+          types.int64, types.int64[::1], types.float64[::1],
+          types.float64[::1])),
+        # Tabu search
+        (neighborhood.find_best_new_assignment,
+         (problem_type, individual_type, types.int64, daily_costs_type,
+          costs_type, types.int64)),
+        # Dynamic tabu search
+        (metrics.family_neighbors, (problem_type, types.int64)),
+        (tabu_memory.solution_hash, (types.uint64[:, ::1], individual_type)),
+        (tabu_memory.population_hashes,
+         (types.uint64[:, ::1], population_type)),
+        # Genetic algorithm
+        (initializations.generate_random_individual, (problem_type,)),
+        (initializations.repair_assignment, (problem_type, individual_type)),
+        (initializations.generate_population, (problem_type, types.int64)),
+        (crossovers.gap_crossovers,
+         (problem_type, population_type, types.float64, population_type,
+          types.int64[::1], mask_type)),
+        (repairs.repair_offsprings,
+         (problem_type, population_type, population_type, types.int64[::1],
+          mask_type, occupancies_type)),
+        (mutations.gap_mutations,
+         (problem_type, population_type, types.float64, types.float64,
+          types.float64, types.float64, costs_type, costs_type)),
+        (evaluation.fast_non_dominated_sort, (costs_type,)),
+        (utils.proportional_random_choice, (types.float64[::1], types.int64)),
+        (utils.seed_compiled_functions, (types.int64,)),
+    ]
+
+
+def warmup(problem=None):
+    """Compiles every hot kernel for its signature, or loads it from the
+    on-disk cache.
+
+    :return: dict mapping each kernel to the time spent compiling or loading
+             it.
+    """
+    problem = get_problem() if problem is None else problem
+    timings = {}
+    for kernel, signature in kernel_signatures(problem):
+        start = time.perf_counter()
+        kernel.compile(signature)
+        name = f'{kernel.py_func.__module__}.{kernel.__name__}'
+        timings[name] = timings.get(name, 0) + time.perf_counter() - start
+    return timings
+
+
+class CompilationListener(event.Listener):
+    """Accumulates the time spent in numba compilations. Compilations
+    triggered by another one (callees) are counted once, in their caller.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.n_compilations = 0
+        self.compile_time = 0.
+
+    def on_start(self, event):
+        if self.depth == 0:
+            self.start = time.perf_counter()
+        self.depth += 1
+
+    def on_end(self, event):
+        self.depth -= 1
+        if self.depth == 0:
+            self.n_compilations += 1
+            self.compile_time += time.perf_counter() - self.start
+
+
+@contextmanager
+def compilation_report():
+    """Measures the time spent compiling versus running in the block.
+    The yielded dict is filled when the block exits.
+    """
+    report = {}
+    listener = CompilationListener()
+    start = time.perf_counter()
+    with event.install_listener('numba:compile', listener):
+        yield report
+    total_time = time.perf_counter() - start
+    report['n_compilations'] = listener.n_compilations
+    report['compile_time'] = listener.compile_time
+    report['run_time'] = total_time - listener.compile_time
+    report['total_time'] = total_time
+
+
+if __name__ == '__main__':
+    with compilation_report() as report:
+        timings = warmup()
+    for name, elapsed in timings.items():
+        print(f'{name}: {elapsed:.3f}s')
+    print(f'{report["n_compilations"]} compilations - '
+          f'compile time: {report["compile_time"]:.3f}s - '
+          f'run time: {report["run_time"]:.3f}s')